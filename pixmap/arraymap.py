@@ -4,6 +4,16 @@ from array import array
 from bounds import Bounds
 from coord import Coord
 from pixelelID import PixelelID
+from pixelCursor import PixelCursor
+from pixmapMask import PixmapMask
+import transforms
+import blend
+import regions
+import checkpoint
+from lut import LUT
+from colorBuffer import ColorBuffer
+from pixmapDiff import PixmapDiff, mapsAreEqual
+from stats import stats
 
 
 
@@ -19,6 +29,15 @@ class ArrayMap(object):
   - clipping test method
   - selection convenience methods
   - iterator protocol
+  - cursor for traversal (see PixelCursor)
+  - geometric transforms (crop, flip, rotate, resize)
+  - multi-resolution pyramid (see Pyramid)
+  - point operations (lookup tables)
+  - compositing another map, with blend modes
+  - regions: flood fill, connected components
+  - checkpoints: save to and load from a file
+  - conversion to and from color spaces (see ColorBuffer)
+  - comparison (see PixmapDiff)
   - know selection mask and get related masks
   - know bounds of selection
   - visibility test method (TODO)
@@ -32,7 +51,6 @@ class ArrayMap(object):
   
   >>> mask = PixmapMask(2, [1, 0, 0, 0])  # 2x2  mask
   >>> map = ArrayMap(2, 2, 1, [0, 0, 0, 0], mask)
-  ('Size of pixelelArray', 4)
   
   >>> map.selectionMask()   #doctest: +ELLIPSIS
   <pixmapMask.PixmapMask object at 0x...>
@@ -44,6 +62,10 @@ class ArrayMap(object):
   >>> map.selectionBounds()
   Bounds(0,0,0,0)
   
+  Random selected pixels
+  >>> map.randomSelectedCoords(2, seed=1)
+  [Coord(0,0), Coord(0,0)]
+  
   
   Clipping is by rect dimensions, regardless of mask.
   >>> map.isClipped(Coord(0,0))
@@ -60,20 +82,101 @@ class ArrayMap(object):
   >>> [index for index in map.pixelelIDsAt(Coord(0,0))]
   [PixelelID(Coord(0,0),0)]
   
+  Pixelels by flat index, in bulk
+  >>> map.flatIndex(PixelelID(Coord(1,1),0)), map.pixelelIDOf(3)
+  (3, PixelelID(Coord(1,1),0))
+  >>> map.setPixelels([1, 3], [7, 8])
+  >>> map.getPixelels(map.flatIndicesAt(Coord(1,1)) + [1])
+  array('B', [8, 7])
+  >>> map.getPixelel(PixelelID(Coord(1,0),0))
+  7
+  >>> map.getPixelel(PixelelID(Coord(0,0),1))
+  Traceback (most recent call last):
+  ...
+  AssertionError: 1
+  
   A map with a totalMask returns a None bounds
   >>> mask = PixmapMask(2, [0, 0, 0, 0])  # total  mask
   >>> map = ArrayMap(2, 2, 1, [0, 0, 0, 0], mask)
-  ('Size of pixelelArray', 4)
   >>> map.selectionBounds()
-  
-  
+
+  String of pixelels of a rect, in row order, as PixelRgn subscripting returns
+  >>> map = ArrayMap(3, 2, 1, [97, 98, 99, 100, 101, 102], PixmapMask(3, [0]*6))
+  >>> map.rectString(Bounds(1,0,2,1))
+  'bcef'
+
+  Geometric transforms return a new map, transforming the selection mask likewise
+  >>> map = ArrayMap(3, 2, 1, [0, 1, 2, 3, 4, 5], PixmapMask(3, [255, 0, 0, 0, 0, 0]))
+  >>> rotated = map.rotate90()
+  >>> rotated.width, rotated.height, list(rotated.pixelelArray)
+  (2, 3, [3, 0, 4, 1, 5, 2])
+  >>> rotated.selectionBounds()
+  Bounds(1,0,1,0)
+  >>> list(map.crop(Bounds(1,1,2,1)).pixelelArray)
+  [4, 5]
+  >>> list(map.resize(6, 2).flipH().pixelelArray)
+  [2, 2, 1, 1, 0, 0, 5, 5, 4, 4, 3, 3]
+  >>> [list(level.pixelelArray) for level in map.pyramid(3, maskAware=False).levels[1:]]
+  [[2, 4], [3]]
+
+  Lookup tables, in bounds, blended by a mask
+  >>> map.applyLUT(LUT.invert(), Bounds(1,0,2,1), PixmapMask(3, [0, 255, 128, 0, 255, 0]))
+  >>> list(map.pixelelArray)
+  [0, 254, 128, 3, 251, 5]
+
+  Compositing, through a mask, at an opacity
+  >>> top = ArrayMap(3, 2, 1, [255] * 6, PixmapMask(3, [0] * 6))
+  >>> map.composite(top, PixmapMask(3, [0, 255, 128, 0, 255, 255]), 'screen', 128)
+  >>> list(map.pixelelArray)
+  [0, 255, 160, 3, 253, 130]
+
+  Color spaces: desaturate the selected pixel of an RGB map
+  >>> map = ArrayMap(2, 1, 3, [255, 0, 0, 0, 0, 255], PixmapMask(2, [255, 0]))
+  >>> buffer = map.toColorBuffer('hsv')
+  >>> buffer.components[1] = array("d", [0.0] * len(buffer))
+  >>> map.fromColorBuffer(buffer, mask=map.selectionMask())
+  >>> list(map.pixelelArray)
+  [255, 255, 255, 0, 0, 255]
+
+  Comparison
+  >>> other = map.flipH()
+  >>> map.diff(other, equalOnly=True)
+  False
+  >>> map.diff(other.flipH(), equalOnly=True)
+  True
+  >>> map.diff(other).bounds
+  Bounds(0,0,1,0)
+
+  Regions: magic wand, and components of a color
+  >>> map = ArrayMap(3, 1, 2, [10, 0, 12, 0, 90, 0], PixmapMask(3, [0] * 3))
+  >>> map.floodFill(Coord(0,0), tolerance=2)[1]
+  Bounds(0,0,1,0)
+  >>> map.labelComponents((90, 0)).bounds
+  [None, Bounds(2,0,2,0)]
+
+  Checkpoints
+  >>> import os, tempfile
+  >>> path = tempfile.mktemp()
+  >>> map.save(path)
+  >>> loaded = ArrayMap.load(path, Bounds(1,0,2,0))
+  >>> loaded.width, list(loaded.pixelelArray), loaded.selectionMask().isTotalMask()
+  (2, [12, 0, 90, 0], True)
+  >>> os.remove(path)
+
+  Loading adopts the arrays read, as a map can, instead of copying
+  >>> values = array('B', [1, 2])
+  >>> ArrayMap(2, 1, 1, values, PixmapMask(2, [0, 0]), copy=False).pixelelArray is values
+  True
+
   '''
   
-  def __init__(self, width, height, bpp, initializer, mask):
+  def __init__(self, width, height, bpp, initializer, mask, copy=True):
     ''' 
     Initialize self from a Gimp drawable. 
     
     Also initialize a PixmapMask for the drawable's selection .
+    
+    If not copy, and initializer is an array of pixelels, self adopts it (e.g. one just read from a file.)
     '''
     '''
     Responsibility: known dimensions.  These are exposed to public.
@@ -89,8 +192,12 @@ class ArrayMap(object):
     which are stored in the array as unsigned chars i.e. ints as specified by "B" arg to array().
     See python docs for module array.
     '''
-    self.pixelelArray = array("B", initializer)
-    print("Size of pixelelArray", len(self.pixelelArray))
+    if isinstance(initializer, array) and initializer.typecode == "B":
+      # A copy by slicing: much faster than array() which iterates over another array
+      self.pixelelArray = initializer[:] if copy else initializer
+    else:
+      self.pixelelArray = array("B", initializer)
+    stats.log("Size of pixelelArray", len(self.pixelelArray))
     
     self.selectionPixmapMask = mask
   
@@ -166,11 +273,15 @@ class ArrayMap(object):
     
     !!! Interpretation from unmasked to selected.
     '''
-    if self.selectionMask().isTotalMask():
+    mask = self.selectionMask()
+    if mask.unmaskedBoundsCache is not None:
+      # e.g. seeded from GIMP's selection bounds.  Mask mutators invalidate the cache.
+      return Bounds(*mask.unmaskedBounds())
+    if mask.isTotalMask():
       return None
     else:
-      self.selectionMask().computeUnmaskedBounds()
-      return Bounds(*self.selectionMask().unmaskedBounds())
+      mask.computeUnmaskedBounds()
+      return Bounds(*mask.unmaskedBounds())
 
 
   '''
@@ -236,6 +347,23 @@ class ArrayMap(object):
     self.pixelelArray[pixelIndex:pixelIndex + self.bpp] = value
 
 
+  def rectString(self, bounds):
+    '''
+    String of pixelels in bounds, in row order.
+
+    The form that PixelRgn subscripting takes, e.g. to flush part of self.
+    A copy: not changed by later writes to self.
+    '''
+    rowStride = self.width * self.bpp
+    if bounds.width == self.width:
+      # Rows are contiguous
+      return self.pixelelArray[bounds.uly * rowStride:(bounds.lry + 1) * rowStride].tostring()
+    start = bounds.ulx * self.bpp
+    end = (bounds.lrx + 1) * self.bpp
+    pixelelArray = self.pixelelArray
+    return "".join([pixelelArray[y * rowStride + start:y * rowStride + end].tostring() for y in bounds.rangeY()])
+
+
   '''
   Get/set pixelel.
   
@@ -243,15 +371,48 @@ class ArrayMap(object):
   since Pixmap[Coord] returns a new array foo, then foo[0] = 1 assigns to the new array, not to self.
   '''
   def setPixelel(self, pixelelID, value):
-    pixel = self[pixelelID.coord]
-    # pixel is an array, modify one of it's pixelels
-    pixel[pixelelID.pixelelIndex] = value
-    # Reassign pixel to self
-    self[pixelelID.coord]=pixel
+    # Index the pixelel directly: no copy of the pixel
+    assert 0 <= pixelelID.pixelelIndex < self.bpp, str(pixelelID.pixelelIndex)
+    coord = pixelelID.coord
+    self.pixelelArray[(coord.y * self.width + coord.x) * self.bpp + pixelelID.pixelelIndex] = value
 
 
   def getPixelel(self, pixelelID):
-    return self[pixelelID.coord][pixelelID.pixelelIndex]
+    assert 0 <= pixelelID.pixelelIndex < self.bpp, str(pixelelID.pixelelIndex)
+    coord = pixelelID.coord
+    return self.pixelelArray[(coord.y * self.width + coord.x) * self.bpp + pixelelID.pixelelIndex]
+
+
+  '''
+  Get/set pixelels by flat index (see PixelelID.flatIndex()), in bulk.
+  
+  For per pixelel algorithms: keep arrays of flat indices (ints), not lists of PixelelID objects.
+  '''
+  def flatIndex(self, pixelelID):
+    ''' Index of pixelelID in pixelelArray. '''
+    return pixelelID.flatIndex(self.width, self.bpp)
+  
+  def pixelelIDOf(self, flatIndex):
+    ''' PixelelID of index in pixelelArray. '''
+    return PixelelID.fromFlatIndex(flatIndex, self.width, self.bpp)
+  
+  def flatIndicesAt(self, key):
+    ''' Sequence of flat indices of pixelels at key (a Coord.) '''
+    start = (key.y * self.width + key.x) * self.bpp
+    return range(start, start + self.bpp)
+  
+  def getPixelels(self, flatIndices):
+    ''' Array of values of pixelels at flatIndices (a sequence of ints.) '''
+    return array("B", map(self.pixelelArray.__getitem__, flatIndices))
+  
+  def setPixelels(self, flatIndices, values):
+    '''
+    Set pixelels at flatIndices (a sequence of ints) to values (a sequence of ints, same length.)
+    Where an index repeats, the last value is set.
+    '''
+    assert len(flatIndices) == len(values)
+    # map() of the array's own method: a loop in C, not in Python
+    map(self.pixelelArray.__setitem__, flatIndices, values)
 
 
 
@@ -282,6 +443,258 @@ class ArrayMap(object):
     for i in range(0, self.bpp):
       yield PixelelID(key, i)
     
+  
+  def randomSelectedCoords(self, count, weighted=False, seed=None):
+    '''
+    List of count Coords of random somewhat selected pixels, with replacement, in one call.
+    weighted: probability proportional to selection (mask value), else uniform.
+    seed: of the random generator, for repeatable samples.
+    Constant time per sample, whatever the size of the selection (see SelectionSampler.)
+    '''
+    width = self.width
+    return [Coord(index % width, index // width)
+            for index in self.selectionMask().randomSelectedIndices(count, weighted, seed)]
+
+
+  def cursor(self, coord=Coord(0,0)):
+    '''
+    PixelCursor at coord, knowing self's selection mask.
+    For allocation free traversal in scan order or of neighbors.
+    '''
+    return PixelCursor(self, coord, self.selectionMask())
+
+
+  '''
+  Responsibility: geometric transforms.
+
+  Return a new ArrayMap (not a Pixmap: not attached to a drawable), whose dimensions may differ,
+  whose selection mask is self's selection mask transformed likewise.
+  Bulk copies and interpolation, not per pixel.  See transforms.py.
+  '''
+  def crop(self, bounds):
+    ''' Subrect bounds of self. '''
+    return self._transformed(transforms.crop, bounds)
+
+  def flipH(self):
+    ''' Mirror left to right. '''
+    return self._transformed(transforms.flipH)
+
+  def flipV(self):
+    ''' Mirror top to bottom. '''
+    return self._transformed(transforms.flipV)
+
+  def transpose(self):
+    ''' Mirror about diagonal from upper left. '''
+    return self._transformed(transforms.transpose)
+
+  def rotate90(self, turns=1):
+    ''' Rotate by turns quarter turns clockwise (negative is counterclockwise.) '''
+    return self._transformed(transforms.rotate90, turns)
+
+  def resize(self, width, height, method='nearest'):
+    ''' Resample to width, height.  method is 'nearest', 'bilinear' or 'box'. '''
+    return self._transformed(transforms.resize, width, height, method)
+
+  def _transformed(self, transform, *args):
+    values, width, height = transform(self.pixelelArray, self.width, self.height, self.bpp, *args)
+    mask = self.selectionMask()._transformed(transform, *args)
+    return ArrayMap(width, height, self.bpp, values, mask)
+
+
+  '''
+  Responsibility: point operations (the new value of a pixelel depends only on its old value.)
+  '''
+  def applyLUT(self, lut, bounds=None, mask=None):
+    '''
+    Map pixelels of self in place by a lookup table.
+
+    lut is a LUT, or tables as taken by LUT() (one table, or a list of one table per channel.)
+    Compose chained LUTs first (see LUT.then()): pixels are touched once.
+
+    bounds: only pixels in bounds (default all.)
+    mask: a PixmapMask same size as self (e.g. self.selectionMask()) by which to blend
+    the mapped pixelels with the original ones (GIMP selection semantics.)  Default: no blending.
+
+    Bulk: translation of strings, by rows (or a band of whole rows), not per pixel.
+    '''
+    if not isinstance(lut, LUT):
+      lut = LUT(lut)
+    if bounds is None:
+      bounds = Bounds(0, 0, self.width - 1, self.height - 1)
+    # By rows when blending, so rows that are not partially selected are shortcut
+    for pixelStart, pixelEnd in self._spansOfBounds(bounds, byRow=mask is not None):
+      old = self.pixelelArray[pixelStart * self.bpp:pixelEnd * self.bpp]
+      new = lut.apply(old, self.bpp)
+      if mask is not None:
+        new = blend.blendArray(old, new, blend.expandMask(mask.pixelelArray[pixelStart:pixelEnd], self.bpp))
+      self.pixelelArray[pixelStart * self.bpp:pixelEnd * self.bpp] = new
+
+
+  def composite(self, src, mask=None, mode='normal', opacity=255, bounds=None):
+    '''
+    Composite src (an ArrayMap same size and bpp as self) onto self in place.
+
+    mode: one of blend.MODES, applied to color channels (src on top of self.)
+    Alpha (bpp 2 or 4) is composited as in 'normal' mode.
+    opacity: 0..255, of src.
+    mask: a PixmapMask same size as self (e.g. self.selectionMask()), by which to blend (GIMP selection semantics):
+    the effective alpha of a pixel is mask value times opacity (rounded, integer.)  Default: no mask.
+    bounds: only pixels in bounds (default all.)
+
+    Bulk, in integers: table lookup of mode, then blending (see blend.py.)
+    The src's alpha is not a weight: composite a src through its alpha by passing it as the mask.
+    '''
+    assert src.width == self.width and src.height == self.height and src.bpp == self.bpp, "Maps differ in size."
+    assert opacity >= 0 and opacity <= 255
+    if bounds is None:
+      bounds = Bounds(0, 0, self.width - 1, self.height - 1)
+    bpp = self.bpp
+    hasAlpha = bpp in (2, 4)
+    for pixelStart, pixelEnd in self._spansOfBounds(bounds, byRow=mask is not None):
+      old = self.pixelelArray[pixelStart * bpp:pixelEnd * bpp]
+      top = src.pixelelArray[pixelStart * bpp:pixelEnd * bpp]
+      new = array("B", blend.modeValues(mode, old, top))
+      if hasAlpha:
+        new[bpp - 1::bpp] = top[bpp - 1::bpp]
+      if mask is not None:
+        alpha = mask.pixelelArray[pixelStart:pixelEnd]
+        if opacity < 255:
+          alpha = array("B", blend.multiplyValues(alpha, array("B", [opacity]) * len(alpha)))
+        new = blend.blendArray(old, new, blend.expandMask(alpha, bpp))
+      elif opacity < 255:
+        new = blend.blendArray(old, new, array("B", [opacity]) * len(old))
+      self.pixelelArray[pixelStart * bpp:pixelEnd * bpp] = new
+
+
+  '''
+  Responsibility: regions.  See regions.py.
+  '''
+  def floodFill(self, seed, tolerance=0, connectivity=4):
+    '''
+    Region of pixels connected to seed (a Coord) whose every pixelel differs from seed's by at most tolerance
+    (as GIMP's fuzzy select, i.e. magic wand.)
+
+    Returns tuple (PixmapMask, Bounds) of the region.
+    connectivity is 4 (edge neighbors) or 8 (also diagonal neighbors.)
+    '''
+    match = regions.matchOfPixels(self.pixelelArray, self.bpp, self[seed], tolerance)
+    values, bounds = regions.floodFill(match, self.width, self.height, seed.y * self.width + seed.x, connectivity)
+    return PixmapMask.initRegion(self.width, self.height, values, bounds), Bounds(*bounds)
+
+  def labelComponents(self, pixel, tolerance=0, connectivity=4):
+    '''
+    regions.Components (labels, counts, bounds) of connected pixels whose every pixelel
+    differs from pixel's (a sequence of ints) by at most tolerance.
+    '''
+    match = regions.matchOfPixels(self.pixelelArray, self.bpp, pixel, tolerance)
+    return regions.labelComponents(match, self.width, self.height, connectivity)
+
+
+  '''
+  Responsibility: color spaces.
+
+  Convert a rect of self to a ColorBuffer (floats, planar, in a color space), operate on it, and convert it back.
+  '''
+  def toColorBuffer(self, space, bounds=None):
+    '''
+    ColorBuffer of pixels of self in bounds (default all), in space (e.g. 'hsv', see ColorBuffer.SPACES.)
+    Alpha (bpp 2 or 4) passes through.
+    '''
+    if bounds is None:
+      bounds = Bounds(0, 0, self.width - 1, self.height - 1)
+    return ColorBuffer.fromPixelels(array("B", self.rectString(bounds)), self.bpp, space)
+
+
+  def fromColorBuffer(self, buffer, bounds=None, mask=None):
+    '''
+    Set pixels of self in bounds (default all) from buffer, as returned by toColorBuffer(space, bounds).
+
+    mask: a PixmapMask same size as self (e.g. self.selectionMask()) by which to blend
+    the converted pixelels with the original ones (GIMP selection semantics.)  Default: no blending.
+    '''
+    if bounds is None:
+      bounds = Bounds(0, 0, self.width - 1, self.height - 1)
+    assert len(buffer) == bounds.width * bounds.height, "ColorBuffer is not the size of bounds."
+    values = buffer.toPixelels(self.bpp)
+    offset = 0
+    for pixelStart, pixelEnd in self._spansOfBounds(bounds, byRow=mask is not None):
+      length = (pixelEnd - pixelStart) * self.bpp
+      new = values[offset:offset + length]
+      if mask is not None:
+        old = self.pixelelArray[pixelStart * self.bpp:pixelEnd * self.bpp]
+        new = blend.blendArray(old, new, blend.expandMask(mask.pixelelArray[pixelStart:pixelEnd], self.bpp))
+      self.pixelelArray[pixelStart * self.bpp:pixelEnd * self.bpp] = new
+      offset += length
+
+
+  '''
+  Responsibility: comparison.
+  '''
+  def diff(self, other, spans=False, equalOnly=False):
+    '''
+    PixmapDiff of self (before) and other (after): changed bounds, mask of changed pixels, per channel errors,
+    and if spans, changed runs of rows.
+
+    If equalOnly, just whether pixelels of self and other are equal (stopping at the first difference.)
+    Selection masks are not compared.
+    '''
+    if equalOnly:
+      return mapsAreEqual(self, other)
+    return PixmapDiff(self, other, spans)
+
+
+  def pyramid(self, levelCount, method='box', maskAware=True):
+    '''
+    Pyramid of self (level 0) and levelCount - 1 coarser levels, each half the size, with reduced selection masks.
+    method: 'box' or 'gaussian'.  maskAware: average colors weighted by selection.
+    After writing to self, call pyramid.update(dirtyBounds).
+    '''
+    # Imported here: module pyramid imports this module
+    from pyramid import Pyramid
+    return Pyramid(self, levelCount, method, maskAware)
+
+
+  '''
+  Responsibility: checkpoints.  See checkpoint.py.
+  '''
+  def save(self, path, compressed=False):
+    '''
+    Write self and its selection mask (with its unmasked bounds, if known) to a file at path.
+    compressed: whether to compress each band of rows, else raw (faster to load, and to load in part.)
+    '''
+    mask = self.selectionMask()
+    maskValues = None if mask is None else mask.pixelelArray
+    unmaskedBounds = None if mask is None else mask.unmaskedBoundsCache
+    checkpoint.save(path, self.pixelelArray, self.width, self.height, self.bpp, maskValues, unmaskedBounds, compressed)
+
+  @staticmethod
+  def load(path, bounds=None):
+    '''
+    New ArrayMap from a file written by save().
+    bounds: only the rect bounds (a Bounds) of the saved map, reading only its rows (or compressed bands.)
+    If no mask was saved, all pixels are selected.
+    '''
+    values, width, height, bpp, maskValues, unmaskedBounds = checkpoint.load(path, bounds)
+    if maskValues is None:
+      mask = PixmapMask.initConstant(width, height, PixmapMask.GIMP_SELECTION_TOTALLY_SELECTED)
+    else:
+      mask = PixmapMask(width, maskValues, height, copy=False)
+      mask.seedUnmaskedBounds(unmaskedBounds)
+    # Adopt the arrays read from the file: copying would double peak memory
+    return ArrayMap(width, height, bpp, values, mask, copy=False)
+
+
+  def _spansOfBounds(self, bounds, byRow=False):
+    '''
+    Generate spans (start, end) of pixel indices (end exclusive) covering bounds.
+    One span per row, or (unless byRow) one span of all rows if bounds is as wide as self (rows are contiguous.)
+    '''
+    if bounds.width == self.width and not byRow:
+      yield bounds.uly * self.width, (bounds.lry + 1) * self.width
+    else:
+      for y in bounds.rangeY():
+        yield y * self.width + bounds.ulx, y * self.width + bounds.lrx + 1
+
     
     
   """
@@ -351,3 +764,11 @@ class ArrayMap(object):
     
   """
 
+
+
+
+" Hot methods counted while stats are enabled.  See stats.py. "
+stats.instrument(ArrayMap, '__getitem__', 'pixelReads')
+stats.instrument(ArrayMap, 'getPixelel', 'pixelReads')
+stats.instrument(ArrayMap, '__setitem__', 'pixelWrites')
+stats.instrument(ArrayMap, 'setPixelel', 'pixelWrites')
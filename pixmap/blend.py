@@ -0,0 +1,135 @@
+
+'''
+Blending of pixelel values by mask values, in bulk, in integer fixed point.
+
+Mask values have GIMP's selection semantics: 0 is totally not selected (keep the old value),
+255 is totally selected (take the new value), and partial values mix proportionally:
+
+  result = (old * (255 - alpha) + new * alpha + 127) // 255
+
+i.e. the weighted average, rounded once, exact at the extremes.
+
+Functions take and return sequences of equal length (arrays or lists.)
+Bulk: map() of builtin operators and string translation, no Python loop per pixelel.
+(Operands of map() are lists of equal length: Python 2 map() pads shorter operands with None.)
+
+
+To test:
+cd to the enclosing directory
+python -m doctest -v blend.py
+
+>>> from array import array
+>>> blendValues(array("B", [10, 10, 10]), array("B", [200, 200, 200]), array("B", [0, 255, 128]))
+[10, 200, 105]
+
+Mask values expanded to one per pixelel
+>>> expandMask(array("B", [0, 255]), 3)
+array('B', [0, 0, 0, 255, 255, 255])
+
+Blend modes, of old (bottom) and new (top) values
+>>> [modeValues(mode, array("B", [0, 128, 255]), array("B", [255, 128, 100])) for mode in MODES]
+[[255, 128, 100], [0, 64, 100], [255, 192, 255], [255, 255, 255], [255, 0, 155]]
+
+Product of values, rounded (as to scale a mask by an opacity)
+>>> multiplyValues(array("B", [255, 128, 0]), array("B", [128, 128, 128]))
+[128, 64, 0]
+'''
+
+from array import array
+from operator import add, mul, floordiv
+
+
+" Translation table: 255 - value "
+INVERT_TABLE = "".join([chr(255 - value) for value in range(0, 256)])
+
+
+def invertValues(values):
+  ''' Array of 255 - value, for an array of unsigned bytes. '''
+  return array("B", values.tostring().translate(INVERT_TABLE))
+
+
+def expandMask(maskValues, bpp):
+  ''' Array repeating each mask value bpp times: one mask value per pixelel instead of per pixel. '''
+  if bpp == 1:
+    return array("B", maskValues)
+  result = array("B", [0]) * (len(maskValues) * bpp)
+  for channel in range(0, bpp):
+    result[channel::bpp] = maskValues
+  return result
+
+
+def blendValues(old, new, alpha):
+  '''
+  List of old values blended toward new values by alpha values (0..255.)
+
+  old, new, alpha are arrays of unsigned bytes, of equal length.
+  '''
+  length = len(old)
+  weighted = map(add, map(mul, old, invertValues(alpha)), map(mul, new, alpha))
+  return map(floordiv, map(add, weighted, [127] * length), [255] * length)
+
+
+def blendArray(old, new, alpha):
+  '''
+  Same as blendValues(), but an array of unsigned bytes.
+
+  Shortcut when alpha is uniformly totally selected or not selected (usual for most rows of a selection.)
+  '''
+  length = len(alpha)
+  if alpha.count(255) == length:
+    return array("B", new)
+  if alpha.count(0) == length:
+    return array("B", old)
+  return array("B", blendValues(old, new, alpha))
+
+
+"""
+Blend modes: the value that new (top) makes of old (bottom), before blending by alpha.
+
+Integer, as GIMP: products are rounded (INT_MULT.)
+Bulk by tables of all pairs of values, indexed by old * 256 + new: one table lookup per pixelel.
+"""
+
+MODES = ('normal', 'multiply', 'screen', 'add', 'difference')
+
+
+def _intMult(a, b):
+  ''' a * b / 255, rounded, in integers (GIMP's INT_MULT.) '''
+  t = a * b + 128
+  return ((t >> 8) + t) >> 8
+
+_MODE_FUNCTIONS = {
+  'multiply': _intMult,
+  'screen': lambda old, new: 255 - _intMult(255 - old, 255 - new),
+  'add': lambda old, new: min(old + new, 255),
+  'difference': lambda old, new: abs(old - new),
+  }
+
+" Table: value * 256, the high part of an index into a mode table. "
+_HIGH_TABLE = [value << 8 for value in range(0, 256)]
+
+" Tables of modes, computed when first used "
+_modeTables = {}
+
+
+def modeTable(mode):
+  ''' List of 65536 results of mode, indexed by old * 256 + new. '''
+  if mode not in _modeTables:
+    function = _MODE_FUNCTIONS[mode]
+    _modeTables[mode] = [function(old, new) for old in range(0, 256) for new in range(0, 256)]
+  return _modeTables[mode]
+
+
+def modeValues(mode, old, new):
+  '''
+  List of results of blend mode (one of MODES) on old and new values, arrays of unsigned bytes of equal length.
+  '''
+  assert mode in MODES, "Unknown blend mode: " + str(mode)
+  if mode == 'normal':
+    return list(new)
+  return map(modeTable(mode).__getitem__, map(add, map(_HIGH_TABLE.__getitem__, old), new))
+
+
+def multiplyValues(a, b):
+  ''' List of products of values a and b (arrays of unsigned bytes), scaled to 0..255 and rounded. '''
+  return modeValues('multiply', a, b)
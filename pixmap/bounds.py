@@ -24,6 +24,11 @@ class Bounds():
     knowing range of X and Y
     knowing width and height
     normalizing self to Bounds with origin at 0,0
+    algebra: intersect, union, clip, expand, containment, area
+    decomposing self into tiles aligned to a grid
+  
+  A Bounds is never empty (UL is asserted to be northwest of LR.)
+  Operations whose result would be empty (e.g. intersect of disjoint bounds) return None instead.
     
   
   
@@ -70,6 +75,26 @@ class Bounds():
     ...
   AssertionError: LRX > ULX
   
+  Algebra
+  >>> a.intersect(Bounds(2,0, 5,2)), a.intersect(Bounds(4,4, 5,5))
+  (Bounds(2,1,3,2), None)
+  >>> a.union(Bounds(4,4, 5,5))
+  Bounds(1,1,5,5)
+  >>> a.clipTo(3, 2), a.expand(1), a.expand(-1), a.expand(-2)
+  (Bounds(1,1,2,1), Bounds(0,0,4,4), Bounds(2,2,2,2), None)
+  >>> a.contains(Bounds(2,2, 3,3)), a.contains(b), a.area()
+  (True, False, 9)
+  >>> a == Bounds(1,1, 3,3)
+  True
+  
+  Hashable, consistent with ==
+  >>> len(set([a, Bounds(1,1, 3,3), b]))
+  2
+  
+  Tiles, aligned to a grid of tiles of 2x2 from the origin
+  >>> list(a.tiles(2, 2))
+  [Bounds(1,1,1,1), Bounds(2,1,3,1), Bounds(1,2,1,3), Bounds(2,2,3,3)]
+  
   '''
   
   def __init__(self, ulx, uly, lrx, lry):
@@ -97,7 +122,6 @@ class Bounds():
     '''
     return cls(ulx, uly, lrx-1, lry-1)
     
-  # TODO isNull or isEmpty
     
   def isInBounds(self, coord):
     return coord.x >= self.ulx and coord.x <= self.lrx \
@@ -115,6 +139,70 @@ class Bounds():
     ''' Return bounds in a new coordinate system whose origin is at the upper left of self. '''
     return Bounds(0,0,self.width-1, self.height-1)
     
+  def __eq__(self, other):
+    return isinstance(other, Bounds) and self.ulx == other.ulx and self.uly == other.uly \
+       and self.lrx == other.lrx and self.lry == other.lry
+  
+  def __ne__(self, other):
+    return not self == other
+  
+  def __hash__(self):
+    return hash((self.ulx, self.uly, self.lrx, self.lry))
+  
+  
+  '''
+  Algebra.  Results are new Bounds, or None if empty.
+  '''
+  def intersect(self, other):
+    ''' Bounds common to self and other, or None if disjoint. '''
+    ulx = max(self.ulx, other.ulx)
+    uly = max(self.uly, other.uly)
+    lrx = min(self.lrx, other.lrx)
+    lry = min(self.lry, other.lry)
+    if ulx > lrx or uly > lry:
+      return None
+    return Bounds(ulx, uly, lrx, lry)
+  
+  def union(self, other):
+    ''' Smallest Bounds containing self and other. '''
+    return Bounds(min(self.ulx, other.ulx), min(self.uly, other.uly),
+                  max(self.lrx, other.lrx), max(self.lry, other.lry))
+  
+  def clipTo(self, width, height):
+    ''' Self clipped to a map of width and height (origin at 0,0), or None if outside. '''
+    return self.intersect(Bounds(0, 0, width - 1, height - 1))
+  
+  def expand(self, radius):
+    ''' Self grown by radius on each side (shrunk if radius is negative), or None if shrunk to empty. '''
+    if 2 * -radius >= self.width or 2 * -radius >= self.height:
+      return None
+    return Bounds(self.ulx - radius, self.uly - radius, self.lrx + radius, self.lry + radius)
+  
+  def contains(self, other):
+    ''' Is other Bounds inside self? '''
+    return other.ulx >= self.ulx and other.lrx <= self.lrx \
+       and other.uly >= self.uly and other.lry <= self.lry
+  
+  def area(self):
+    ''' Count of pixels. '''
+    return self.width * self.height
+  
+  
+  def tiles(self, tileWidth=64, tileHeight=64):
+    '''
+    Generator of Bounds of self cut by a grid of tiles of tileWidth, tileHeight from the origin,
+    in row order (as rows of pixelels are stored, and as GIMP's 64x64 tiles.)
+    
+    Tiles at the edges of self are partial.  A tile is never split between two Bounds,
+    so work on each Bounds touches one tile of storage (e.g. for a PixelRgn, or a worker.)
+    '''
+    for tileUly in range(self.uly - self.uly % tileHeight, self.lry + 1, tileHeight):
+      uly = max(tileUly, self.uly)
+      lry = min(tileUly + tileHeight - 1, self.lry)
+      for tileUlx in range(self.ulx - self.ulx % tileWidth, self.lrx + 1, tileWidth):
+        yield Bounds(max(tileUlx, self.ulx), uly, min(tileUlx + tileWidth - 1, self.lrx), lry)
+  
+  
   def __repr__(self):
     " Strict repr: string when execed will reproduce. "
     return "Bounds(" + str(self.ulx) + "," + str(self.uly) + "," + str(self.lrx) + "," + str(self.lry) + ")"
@@ -0,0 +1,188 @@
+'''
+Checkpoint files of pixelels and mask values of a map (as in ArrayMap and its PixmapMask.)
+
+Format (little-endian):
+- header: magic, version, element type (array typecode), bpp, flags, width, height, tile height, unmasked bounds
+- uncompressed: the pixelels, then (if the mask is present) the mask values, both raw in row order
+- compressed: an index of compressed sizes of tiles, then the tiles (bands of tile height rows,
+  each compressed by zlib separately): pixelel tiles, then mask tiles
+
+Loading an uncompressed file reads the raw bytes straight into arrays (array.fromfile), without parsing:
+resuming is at the speed of the disk.
+Loading a rect (bounds) reads only its rows (seeking), or decompresses only the tiles overlapping it.
+
+Python arrays own their memory, so a file cannot be memory mapped as the array of a map (zero copy):
+the nearest is reading only what is needed, directly into the array.
+
+Knows nothing about ArrayMap or PixmapMask: see ArrayMap.save() and ArrayMap.load().
+
+
+To test:
+cd to the enclosing directory
+python -m doctest -v checkpoint.py
+
+>>> import os, tempfile
+>>> from array import array
+>>> from bounds import Bounds
+>>> path = tempfile.mktemp()
+
+A 3x2 map, 2 pixelels per pixel, with a mask
+>>> values = array("B", range(12))
+>>> mask = array("B", [0, 255, 0, 0, 9, 0])
+>>> for compressed in (False, True):
+...   save(path, values, 3, 2, 2, mask, (1, 0, 1, 1), compressed, tileHeight=1)
+...   assert load(path) == (values, 3, 2, 2, mask, (1, 0, 1, 1)), compressed
+...   print load(path, Bounds(1,1,2,1))
+(array('B', [8, 9, 10, 11]), 2, 1, 2, array('B', [9, 0]), None)
+(array('B', [8, 9, 10, 11]), 2, 1, 2, array('B', [9, 0]), None)
+
+Without mask
+>>> save(path, values, 3, 2, 2)
+>>> load(path)[4:]
+(None, None)
+
+>>> os.remove(path)
+'''
+
+import struct
+import sys
+import zlib
+from array import array
+
+from bounds import Bounds
+
+
+MAGIC = "PXMP"
+VERSION = 1
+# magic, version, typecode, bpp, flags, width, height, tileHeight, unmasked bounds (ulx, uly, lrx, lry)
+HEADER = struct.Struct("<4sBcBBIIIiiii")
+
+HAS_MASK = 1
+IS_COMPRESSED = 2
+HAS_UNMASKED_BOUNDS = 4
+
+DEFAULT_TILE_HEIGHT = 64
+
+
+
+def save(path, values, width, height, bpp, maskValues=None, unmaskedBounds=None, compressed=False,
+         tileHeight=DEFAULT_TILE_HEIGHT):
+  '''
+  Write values (array of width*height*bpp pixelels) and optional maskValues (array of width*height)
+  with optional unmaskedBounds (tuple) to a file at path.
+
+  compressed: whether to compress each tile (a band of tileHeight rows.)
+  '''
+  assert values.typecode == "B" and len(values) == width * height * bpp
+  flags = 0
+  if maskValues is not None:
+    assert len(maskValues) == width * height
+    flags |= HAS_MASK
+  if compressed:
+    flags |= IS_COMPRESSED
+  if unmaskedBounds is not None:
+    flags |= HAS_UNMASKED_BOUNDS
+  else:
+    unmaskedBounds = (-1, -1, -1, -1)
+  sections = [(values, width * bpp)]
+  if maskValues is not None:
+    sections.append((maskValues, width))
+
+  with open(path, "wb") as file:
+    file.write(HEADER.pack(MAGIC, VERSION, values.typecode, bpp, flags, width, height, tileHeight, *unmaskedBounds))
+    if not compressed:
+      for sectionValues, _ in sections:
+        sectionValues.tofile(file)
+    else:
+      tiles = []
+      for sectionValues, rowLength in sections:
+        tileLength = rowLength * tileHeight
+        tiles.extend([zlib.compress(buffer(sectionValues, start, tileLength))
+                      for start in range(0, len(sectionValues), tileLength)])
+      _littleEndian(array("I", [len(tile) for tile in tiles])).tofile(file)
+      for tile in tiles:
+        file.write(tile)
+
+
+def load(path, bounds=None):
+  '''
+  Read a file written by save().
+
+  Returns tuple (values, width, height, bpp, maskValues, unmaskedBounds), the last two None if not saved.
+  bounds: a Bounds, to read only that rect (whose width and height are returned, and unmaskedBounds is None.)
+  '''
+  with open(path, "rb") as file:
+    header = file.read(HEADER.size)
+    magic, version, typecode, bpp, flags, width, height, tileHeight = HEADER.unpack(header)[0:8]
+    if magic != MAGIC or version != VERSION:
+      raise IOError("Not a pixmap checkpoint file: " + str(path))
+    unmaskedBounds = HEADER.unpack(header)[8:] if flags & HAS_UNMASKED_BOUNDS else None
+    if bounds is None:
+      bounds = Bounds(0, 0, width - 1, height - 1)
+    else:
+      assert bounds.ulx >= 0 and bounds.uly >= 0 and bounds.lrx < width and bounds.lry < height, "Illegal bounds."
+      unmaskedBounds = None
+
+    rowLengths = [width * bpp]
+    if flags & HAS_MASK:
+      rowLengths.append(width)
+    if flags & IS_COMPRESSED:
+      results = _loadTiles(file, typecode, width, height, tileHeight, bounds, rowLengths)
+    else:
+      results = _loadRaw(file, typecode, width, height, bounds, rowLengths)
+
+  maskValues = results[1] if flags & HAS_MASK else None
+  return results[0], bounds.width, bounds.height, bpp, maskValues, unmaskedBounds
+
+
+def _loadRaw(file, typecode, width, height, bounds, rowLengths):
+  ''' List of arrays of the rect bounds of each section, read by seeking to its rows. '''
+  results = []
+  sectionStart = HEADER.size
+  for rowLength in rowLengths:
+    perPixel = rowLength // width
+    values = array(typecode)
+    if bounds.width == width:
+      # Rows are contiguous
+      file.seek(sectionStart + bounds.uly * rowLength)
+      values.fromfile(file, bounds.height * rowLength)
+    else:
+      for y in bounds.rangeY():
+        file.seek(sectionStart + y * rowLength + bounds.ulx * perPixel)
+        values.fromfile(file, bounds.width * perPixel)
+    results.append(values)
+    sectionStart += rowLength * height
+  return results
+
+
+def _loadTiles(file, typecode, width, height, tileHeight, bounds, rowLengths):
+  ''' List of arrays of the rect bounds of each section, decompressing only tiles overlapping bounds. '''
+  tileCount = (height + tileHeight - 1) // tileHeight
+  sizes = array("I")
+  sizes.fromfile(file, tileCount * len(rowLengths))
+  sizes = _littleEndian(sizes)
+  tileStart = file.tell()
+  results = []
+  for section, rowLength in enumerate(rowLengths):
+    perPixel = rowLength // width
+    values = array(typecode)
+    for tile in range(0, tileCount):
+      size = sizes[section * tileCount + tile]
+      firstRow = tile * tileHeight
+      lastRow = min(firstRow + tileHeight, height) - 1
+      if firstRow <= bounds.lry and lastRow >= bounds.uly:
+        file.seek(tileStart)
+        tileValues = zlib.decompress(file.read(size))
+        for y in range(max(firstRow, bounds.uly), min(lastRow, bounds.lry) + 1):
+          start = (y - firstRow) * rowLength + bounds.ulx * perPixel
+          values.fromstring(tileValues[start:start + bounds.width * perPixel])
+      tileStart += size
+    results.append(values)
+  return results
+
+
+def _littleEndian(values):
+  ''' values (an array) in little-endian byte order, i.e. swapped on a big-endian machine (both ways.) '''
+  if sys.byteorder == "big":
+    values.byteswap()
+  return values
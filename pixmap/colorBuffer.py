@@ -0,0 +1,371 @@
+
+from array import array
+from operator import add, sub, mul, div, mod, gt, ne
+
+
+'''
+Tables over the 8-bit domain of pixelels, computed once.
+'''
+# Pixelel to unit interval [0,1]
+_UNIT = [value / 255.0 for value in range(0, 256)]
+# Weights of GIMP's intensity (as in desaturate), premultiplied for each 8-bit value
+_GRAY_WEIGHTS = (0.30, 0.59, 0.11)
+_GRAY_TABLES = [[value * weight / 255.0 for value in range(0, 256)] for weight in _GRAY_WEIGHTS]
+# Reciprocals for hue and saturation (zero where the divisor is zero, i.e. for grays)
+_RECIPROCAL = [0.0] + [1.0 / value for value in range(1, 256)]
+_RECIPROCAL_SIX = [0.0] + [1.0 / (6 * value) for value in range(1, 256)]
+# Over sums of two pixelels (max + min): lightness, and reciprocal of the divisor of HSL saturation
+_HALF_UNIT = [total / 510.0 for total in range(0, 511)]
+_RECIPROCAL_SUM = [1.0 / total if 0 < total <= 255 else 1.0 / (510 - total) if 255 < total < 510 else 0.0
+                   for total in range(0, 511)]
+# Keys packing an 8-bit RGB color into one int
+_KEY_TABLES = ([value << 16 for value in range(0, 256)], [value << 8 for value in range(0, 256)])
+# sRGB companding: pixelel to linear light
+_LINEAR = [value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4 for value in _UNIT]
+
+# CIE constants, D65 white
+_WHITE = (0.95047, 1.0, 1.08883)
+_EPSILON = 216.0 / 24389
+_KAPPA = 24389.0 / 27
+
+
+
+class ColorBuffer(object):
+  '''
+  Pixels of a rect of an ArrayMap, converted to floats in a color space, for color operations.
+
+  Planar: one array of floats per component (not interleaved as in ArrayMap), so an operation
+  on one component (e.g. rotate hue) is a bulk operation on one array.
+  Alpha (for bpp 2 or 4) is passed through unchanged, as an array of pixelels.
+
+  Color spaces and their components:
+  - 'rgb': red, green, blue in [0,1]
+  - 'gray': intensity in [0,1] (GIMP's weights 0.30, 0.59, 0.11)
+  - 'hsv': hue in [0,1), saturation, value in [0,1] (as module colorsys)
+  - 'hsl': hue in [0,1), saturation, lightness in [0,1]
+  - 'lab': CIE L* in [0,100], a*, b* about [-128,127] (sRGB, D65 white)
+
+  Gray pixmaps (bpp 1 or 2) convert as RGB with equal components.
+  Converting back to a gray pixmap takes the intensity.
+
+  Conversions are bulk: map() of builtin operators and of 8-bit tables over whole components,
+  not a Python call per pixel.  Where a formula has cases (e.g. the hue sector), each case is computed
+  for all pixels, then picked per pixel.  Results are those of module colorsys, up to rounding of floats
+  (rarely, a pixelel converted back differs by one, when the exact value is halfway between two pixelels.)
+  Except Lab from 8-bit RGB, which converts each distinct color once, cached across conversions up to CACHE_LIMIT colors.
+  Converting back rounds and clamps to [0,255].
+
+  See ArrayMap.toColorBuffer() and ArrayMap.fromColorBuffer().
+
+
+  To test:
+  cd to the enclosing directory
+  python -m doctest -v colorBuffer.py
+
+  RGBA pixels: red, half transparent gray
+  >>> values = array("B", [255, 0, 0, 255, 128, 128, 128, 100])
+  >>> buffer = ColorBuffer.fromPixelels(values, 4, 'hsv')
+  >>> [round(component, 3) for component in buffer.components[2]]
+  [1.0, 0.502]
+  >>> buffer.alpha
+  array('B', [255, 100])
+
+  Rotate hue by a third, and convert back
+  >>> buffer.components[0] = array("d", [(hue + 1/3.0) % 1.0 for hue in buffer.components[0]])
+  >>> buffer.toPixelels(4)
+  array('B', [0, 255, 0, 255, 128, 128, 128, 100])
+
+  Round trips (except to gray, which loses color)
+  >>> for space in ('rgb', 'hsv', 'hsl', 'lab'):
+  ...   assert ColorBuffer.fromPixelels(values, 4, space).toPixelels(4) == values, space
+  >>> ColorBuffer.fromPixelels(array("B", [10, 200]), 1, 'lab').toPixelels(1)
+  array('B', [10, 200])
+
+  Gray
+  >>> ColorBuffer.fromPixelels(values, 4, 'gray').toPixelels(2)
+  array('B', [77, 255, 128, 100])
+
+  Lab of white
+  >>> [int(round(component[0])) for component in ColorBuffer.fromPixelels(array("B", [255] * 3), 3, 'lab').components]
+  [100, 0, 0]
+
+  Same as module colorsys
+  >>> import colorsys
+  >>> colors = [(0, 0, 0), (255, 255, 255), (10, 200, 30), (200, 30, 10), (30, 10, 200), (255, 0, 255), (90, 90, 91)]
+  >>> values = array("B", sum(colors, ()))
+  >>> hsv = zip(*ColorBuffer.fromPixelels(values, 3, 'hsv').components)
+  >>> expected = [colorsys.rgb_to_hsv(*[pixelel / 255.0 for pixelel in color]) for color in colors]
+  >>> max([abs(a - b) for color, other in zip(hsv, expected) for a, b in zip(color, other)]) < 1e-12
+  True
+  >>> buffer = ColorBuffer('hsl', [array("d", [0.05, 0.6]), array("d", [0.5, 1.0]), array("d", [0.25, 0.7])])
+  >>> list(buffer.toPixelels(3)) == [int(round(unit * 255)) for hue, saturation, lightness in zip(*buffer.components)
+  ...                                for unit in colorsys.hls_to_rgb(hue, lightness, saturation)]
+  True
+
+  The cache never exceeds its limit: more distinct colors than the limit are not cached
+  >>> ColorBuffer.CACHE_LIMIT, limit = 1, ColorBuffer.CACHE_LIMIT
+  >>> ColorBuffer._forwardCaches.clear()
+  >>> len(ColorBuffer.fromPixelels(values, 3, 'lab')), len(ColorBuffer._forwardCaches['lab'])
+  (7, 0)
+  >>> ColorBuffer.CACHE_LIMIT = limit
+  '''
+
+  SPACES = ('rgb', 'gray', 'hsv', 'hsl', 'lab')
+
+  # Per space (only Lab): cache of conversions of distinct colors from 8-bit RGB (keyed by packed int.)
+  # Hard limit on size: cleared when a conversion would overfill it.
+  # Not conversely: colors of floats rarely repeat after an operation, so they are only deduplicated within a conversion.
+  _forwardCaches = {}
+  CACHE_LIMIT = 1 << 16
+
+
+  def __init__(self, space, components, alpha=None):
+    '''
+    components: list of arrays of floats, one per component of space, of equal length.
+    alpha: array of pixelels, or None.
+    '''
+    assert space in ColorBuffer.SPACES, "Unknown color space: " + str(space)
+    self.space = space
+    self.components = components
+    self.alpha = alpha
+
+  def __len__(self):
+    ''' Count of pixels. '''
+    return len(self.components[0])
+
+
+  '''
+  Responsibility: conversion from pixelels.
+  '''
+  @classmethod
+  def fromPixelels(cls, values, bpp, space):
+    '''
+    ColorBuffer in space of values, an array of interleaved pixelels, bpp per pixel.
+    '''
+    assert bpp in (1, 2, 3, 4)
+    if bpp in (1, 3):
+      alpha = None
+    else:
+      alpha = values[bpp - 1::bpp]
+    if bpp <= 2:
+      gray = values[0::bpp]
+      rgb = (gray, gray, gray)
+    else:
+      rgb = (values[0::bpp], values[1::bpp], values[2::bpp])
+
+    if space == 'rgb':
+      components = [array("d", map(_UNIT.__getitem__, channel)) for channel in rgb]
+    elif space == 'gray':
+      if bpp <= 2:
+        components = [array("d", map(_UNIT.__getitem__, rgb[0]))]
+      else:
+        weighted = [map(table.__getitem__, channel) for table, channel in zip(_GRAY_TABLES, rgb)]
+        components = [array("d", map(add, map(add, weighted[0], weighted[1]), weighted[2]))]
+    elif space in _FORWARD_BULK:
+      components = [array("d", component) for component in _FORWARD_BULK[space](*rgb)]
+    else:
+      components = cls._convertDistinct(space, rgb)
+    return cls(space, components, alpha)
+
+
+  @classmethod
+  def _convertDistinct(cls, space, rgb):
+    ''' Components converted from 8-bit RGB channels, converting each distinct color once. '''
+    keys = map(add, map(add, map(_KEY_TABLES[0].__getitem__, rgb[0]), map(_KEY_TABLES[1].__getitem__, rgb[1])), rgb[2])
+    distinct = set(keys)
+    cache = cls._forwardCaches.setdefault(space, {})
+    missing = distinct.difference(cache)
+    if len(cache) + len(missing) > cls.CACHE_LIMIT:
+      cache.clear()
+      missing = distinct
+      if len(distinct) > cls.CACHE_LIMIT:
+        # Too many colors to keep: convert into a dictionary of this conversion only
+        cache = {}
+    convert = _FORWARD[space]
+    for key in missing:
+      cache[key] = convert(key >> 16, (key >> 8) & 0xFF, key & 0xFF)
+    return [array("d", component) for component in zip(*map(cache.__getitem__, keys))]
+
+
+  '''
+  Responsibility: conversion to pixelels.
+  '''
+  def toPixelels(self, bpp):
+    ''' Array of interleaved pixelels, bpp per pixel, converted from self. '''
+    assert bpp in (1, 2, 3, 4)
+    assert (bpp in (2, 4)) == (self.alpha is not None), "Alpha of buffer does not match bpp."
+    length = len(self)
+    if bpp <= 2:
+      channels = [self._grayPixelels()]
+    elif self.space == 'gray':
+      gray = self._unitToPixelels(self.components[0])
+      channels = [gray, gray, gray]
+    else:
+      channels = self._rgbPixelels()
+    if self.alpha is not None:
+      channels.append(self.alpha)
+
+    result = array("B", [0]) * (length * bpp)
+    for channel, values in enumerate(channels):
+      result[channel::bpp] = values
+    return result
+
+
+  def _unitToPixelels(self, component):
+    ''' Array of pixelels from floats in [0,1]: rounded and clamped. '''
+    return array("B", _pixelelsOfUnits(component))
+
+
+  def _rgbPixelels(self):
+    ''' List of three arrays of pixelels. '''
+    if self.space == 'rgb':
+      return [self._unitToPixelels(component) for component in self.components]
+    return [array("B", channel) for channel in _INVERSE[self.space](*self.components)]
+
+
+  def _grayPixelels(self):
+    ''' Array of pixelels of intensity. '''
+    if self.space == 'gray':
+      return self._unitToPixelels(self.components[0])
+    weighted = [map(table.__getitem__, channel) for table, channel in zip(_GRAY_TABLES, self._rgbPixelels())]
+    return self._unitToPixelels(map(add, map(add, weighted[0], weighted[1]), weighted[2]))
+
+
+
+'''
+Conversion of one color, from 8-bit RGB to components of a space.
+'''
+
+def _labFromRGB(red, green, blue):
+  red = _LINEAR[red]
+  green = _LINEAR[green]
+  blue = _LINEAR[blue]
+  x = (0.4124564 * red + 0.3575761 * green + 0.1804375 * blue) / _WHITE[0]
+  y = (0.2126729 * red + 0.7151522 * green + 0.0721750 * blue) / _WHITE[1]
+  z = (0.0193339 * red + 0.1191920 * green + 0.9503041 * blue) / _WHITE[2]
+  fx, fy, fz = [t ** (1.0 / 3) if t > _EPSILON else (_KAPPA * t + 16) / 116 for t in (x, y, z)]
+  return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+_FORWARD = {'lab': _labFromRGB}
+
+
+
+'''
+Conversions of whole components.
+
+From 8-bit RGB (sequences of pixelels): lists of components.
+To RGB: three lists of pixelels.
+Same formulas as module colorsys, rearranged for bulk: results are equal up to rounding of floats.
+'''
+
+def _constant(value, length):
+  return [value] * length
+
+def _pick(choices, indices):
+  ''' List whose element i is choices[indices[i]][i]. '''
+  return map(tuple.__getitem__, zip(*choices), indices)
+
+def _clamped(values, low=0.0, high=1.0):
+  ''' values clamped to [low, high], not copied if already inside. '''
+  if values and (min(values) < low or max(values) > high):
+    length = len(values)
+    return map(min, map(max, values, _constant(low, length)), _constant(high, length))
+  return values
+
+def _pixelelsOfUnits(units):
+  ''' List of pixelels from floats in [0,1]: rounded and clamped. '''
+  length = len(units)
+  scaled = map(int, map(round, map(mul, units, _constant(255.0, length))))
+  return map(min, map(max, scaled, _constant(0, length)), _constant(255, length))
+
+
+def _hueAndRange(red, green, blue):
+  '''
+  Tuple (hue, maximum, minimum, delta) of 8-bit channels: hue in [0,1) as colorsys, the others pixelels.
+
+  Hue is numerator / (6 * delta) (mod 1) where the numerator depends on which channel is the maximum (red first.)
+  '''
+  length = len(red)
+  maximum = map(max, red, green, blue)
+  minimum = map(min, red, green, blue)
+  delta = map(sub, maximum, minimum)
+  # 0: red is maximum, 1: else green is, 2: else blue is
+  notRed = map(ne, red, maximum)
+  case = map(add, notRed, map(mul, notRed, map(ne, green, maximum)))
+  twice = map(add, delta, delta)
+  numerator = _pick((map(sub, green, blue),
+                     map(add, map(sub, blue, red), twice),
+                     map(add, map(sub, red, green), map(add, twice, twice))), case)
+  hue = map(mod, map(mul, numerator, map(_RECIPROCAL_SIX.__getitem__, delta)), _constant(1.0, length))
+  return hue, maximum, minimum, delta
+
+def _hsvFromRGBComponents(red, green, blue):
+  hue, maximum, _, delta = _hueAndRange(red, green, blue)
+  return hue, map(mul, delta, map(_RECIPROCAL.__getitem__, maximum)), map(_UNIT.__getitem__, maximum)
+
+def _hslFromRGBComponents(red, green, blue):
+  hue, maximum, minimum, delta = _hueAndRange(red, green, blue)
+  total = map(add, maximum, minimum)
+  return hue, map(mul, delta, map(_RECIPROCAL_SUM.__getitem__, total)), map(_HALF_UNIT.__getitem__, total)
+
+
+" Per hue sector: which of (maximum, middle, minimum) is red, green, blue.  Sector 6 (hue 1.0) is as sector 0. "
+_SECTORS = ((0, 1, 2, 2, 1, 0, 0), (1, 0, 0, 1, 2, 2, 1), (2, 2, 1, 0, 0, 1, 2))
+
+def _rgbOfRange(hue, maximum, delta):
+  '''
+  Three lists of pixelels of hue and range: maximum is 255 * max + 0.5 (to round), delta is 255 * (max - min).
+  The middle channel is less than the maximum by delta times the distance from 6 * hue to the nearest odd integer.
+  '''
+  length = len(hue)
+  if hue and (min(hue) < 0.0 or max(hue) > 1.0):
+    hue = map(mod, hue, _constant(1.0, length))
+  hue6 = map(mul, hue, _constant(6.0, length))
+  sector = map(int, hue6)
+  distance = map(abs, map(sub, map(mod, hue6, _constant(2.0, length)), _constant(1.0, length)))
+  choices = zip(map(int, maximum),
+                map(int, map(sub, maximum, map(mul, delta, distance))),
+                map(int, map(sub, maximum, delta)))
+  return [map(tuple.__getitem__, choices, map(table.__getitem__, sector)) for table in _SECTORS]
+
+def _rgbFromHSVComponents(hue, saturation, value):
+  length = len(hue)
+  value = map(mul, _clamped(value), _constant(255.0, length))
+  delta = map(mul, value, _clamped(saturation))
+  return _rgbOfRange(hue, map(add, value, _constant(0.5, length)), delta)
+
+def _rgbFromHSLComponents(hue, saturation, lightness):
+  length = len(hue)
+  lightness = _clamped(lightness)
+  # Half the range: max is lightness plus it, min is lightness less it
+  half = map(mul, _clamped(saturation), map(min, lightness, map(sub, _constant(1.0, length), lightness)))
+  maximum = map(add, map(mul, map(add, lightness, half), _constant(255.0, length)), _constant(0.5, length))
+  return _rgbOfRange(hue, maximum, map(mul, half, _constant(510.0, length)))
+
+
+def _rgbFromLabComponents(lightness, a, b):
+  length = len(lightness)
+  fy = map(div, map(add, lightness, _constant(16, length)), _constant(116.0, length))
+  fx = map(add, fy, map(div, a, _constant(500.0, length)))
+  fz = map(sub, fy, map(div, b, _constant(200.0, length)))
+  xyz = []
+  for f, white in zip((fx, fy, fz), _WHITE):
+    cube = map(pow, f, _constant(3, length))
+    linear = map(div, map(sub, map(mul, _constant(116, length), f), _constant(16, length)), _constant(_KAPPA, length))
+    xyz.append(map(mul, _pick((linear, cube), map(gt, cube, _constant(_EPSILON, length))), _constant(white, length)))
+  rgb = []
+  for weights in ((3.2404542, -1.5371385, -0.4985314),
+                  (-0.9692660, 1.8760108, 0.0415560),
+                  (0.0556434, -0.2040259, 1.0572252)):
+    terms = [map(mul, _constant(weight, length), component) for weight, component in zip(weights, xyz)]
+    value = map(add, map(add, terms[0], terms[1]), terms[2])
+    low = map(mul, _constant(12.92, length), value)
+    high = map(sub, map(mul, _constant(1.055, length),
+                        map(pow, map(max, value, _constant(0.0, length)), _constant(1 / 2.4, length))),
+               _constant(0.055, length))
+    rgb.append(_pixelelsOfUnits(_pick((low, high), map(gt, value, _constant(0.0031308, length)))))
+  return rgb
+
+
+_FORWARD_BULK = {'hsv': _hsvFromRGBComponents, 'hsl': _hslFromRGBComponents}
+_INVERSE = {'hsv': _rgbFromHSVComponents, 'hsl': _rgbFromHSLComponents, 'lab': _rgbFromLabComponents}
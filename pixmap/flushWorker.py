@@ -0,0 +1,118 @@
+
+import threading
+
+from bounds import Bounds
+
+
+class FlushWorker(object):
+  '''
+  Background writer for Pixmap.flushAsync(): double buffering of flushes.
+
+  The caller (front) takes a snapshot of the buffer (a string) and submits it with its bounds.
+  The worker thread (back) writes snapshots, while the caller continues to compute on the buffer.
+  At most one snapshot is pending.
+  A submission while one is pending is coalesced with it:
+  it replaces it by a snapshot of the union of their bounds, taken from the (newer) buffer.
+
+  Knows nothing about GIMP: writing is by a function passed in.
+  Write function takes (bounds, string).
+
+  Exceptions raised by the write function are re-raised by wait().
+
+
+  To test:
+  cd to the enclosing directory
+  python -m doctest -v flushWorker.py
+
+  Test setup: a write function that blocks until released, and a buffer.
+  >>> import threading
+  >>> writes = []
+  >>> started = threading.Event()
+  >>> release = threading.Event()
+  >>> def write(bounds, pixels):
+  ...   started.set()
+  ...   release.wait()
+  ...   writes.append((bounds, pixels))
+  >>> buffer = ['a']
+  >>> def snapshot(bounds):
+  ...   return buffer[0]
+  >>> worker = FlushWorker(write)
+
+  First flush is being written, the next two are coalesced.
+  >>> worker.submit(Bounds(0,0,1,1), snapshot)
+  >>> started.wait(5)
+  True
+  >>> buffer[0] = 'b'
+  >>> worker.submit(Bounds(2,2,3,3), snapshot)
+  >>> buffer[0] = 'c'
+  >>> worker.submit(Bounds(0,2,0,2), snapshot)
+  >>> release.set()
+  >>> worker.wait()
+  >>> writes
+  [(Bounds(0,0,1,1), 'a'), (Bounds(0,2,3,3), 'c')]
+
+  Errors in the background are raised by wait()
+  >>> def failingWrite(bounds, pixels):
+  ...   raise IOError("lost")
+  >>> worker = FlushWorker(failingWrite)
+  >>> worker.submit(Bounds(0,0,1,1), snapshot)
+  >>> worker.wait()
+  Traceback (most recent call last):
+  ...
+  IOError: lost
+  '''
+
+  def __init__(self, write):
+    self.write = write
+    self.condition = threading.Condition()
+    self.pending = None   # (bounds, snapshot) not yet taken by worker
+    self.error = None
+    self.thread = None
+
+
+  def submit(self, bounds, snapshotFunction):
+    '''
+    Snapshot bounds of the buffer, by calling snapshotFunction(bounds), and queue it for writing.
+    Returns without waiting for the write.
+    '''
+    with self.condition:
+      if self.pending is not None:
+        # Coalesce: the newer buffer also holds the pending changes
+        bounds = bounds.union(self.pending[0])
+      self.pending = (bounds, snapshotFunction(bounds))
+      if self.thread is None:
+        # Thread lives while there is work, so no idle thread outlives the plugin.
+        self.thread = threading.Thread(target=self._run, name="FlushWorker")
+        self.thread.daemon = True
+        self.thread.start()
+
+
+  def wait(self):
+    '''
+    Barrier: return when all submitted snapshots are written.
+    Raise the exception (if any) raised by a write since the last wait().
+    '''
+    with self.condition:
+      while self.thread is not None:
+        self.condition.wait()
+      error = self.error
+      self.error = None
+    if error is not None:
+      raise error
+
+
+  def _run(self):
+    ''' Body of worker thread: write pending snapshots until there are none. '''
+    while True:
+      with self.condition:
+        if self.pending is None:
+          self.thread = None
+          self.condition.notify_all()
+          return
+        bounds, pixels = self.pending
+        self.pending = None
+      try:
+        self.write(bounds, pixels)
+      except Exception as error:
+        self.error = error
+
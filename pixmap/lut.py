@@ -0,0 +1,145 @@
+
+from array import array
+
+
+class LUT(object):
+  '''
+  Lookup table: a map from pixelel value (0..255) to pixelel value, per channel.
+
+  Curves, levels, gamma, posterize, invert etc. are all LUTs.
+
+  Either one table for every channel, or a list of tables, one per channel of the pixel
+  (a table of None means that channel is unchanged, e.g. alpha.)
+  A table is a sequence of 256 ints in [0,255].
+
+  LUTs compose: a.then(b) is one LUT equivalent to applying a, then b.
+  Compose a chain before applying it: the pixels are touched once.
+
+  Applied in bulk by string translation of each channel (see apply(), ArrayMap.applyLUT().)
+
+
+  To test:
+  cd to the enclosing directory
+  python -m doctest -v lut.py
+
+  >>> invert = LUT.invert()
+  >>> invert.apply(array("B", [0, 10, 255]), 1)
+  array('B', [255, 245, 0])
+
+  Per channel, here leaving alpha unchanged
+  >>> perChannel = LUT([range(255, -1, -1), None])
+  >>> perChannel.apply(array("B", [0, 10, 1, 20]), 2)
+  array('B', [255, 10, 254, 20])
+
+  Composition
+  >>> posterize = LUT.posterize(2)
+  >>> posterize.apply(array("B", [0, 100, 200]), 1)
+  array('B', [0, 0, 255])
+  >>> invert.then(posterize).apply(array("B", [0, 100, 200]), 1)
+  array('B', [255, 255, 0])
+  >>> invert.then(perChannel).apply(array("B", [0, 10, 1, 20]), 2)
+  array('B', [0, 245, 1, 235])
+
+  Levels and gamma
+  >>> LUT.levels(100, 200).apply(array("B", [50, 150, 250]), 1)
+  array('B', [0, 128, 255])
+  >>> LUT.gamma(2.0).apply(array("B", [0, 64, 255]), 1)
+  array('B', [0, 128, 255])
+  '''
+
+  def __init__(self, tables):
+    '''
+    tables: one table (for every channel) or a list of tables (one per channel, None for unchanged.)
+    '''
+    if isinstance(tables, str) or (len(tables) == 256 and isinstance(tables[0], int)):
+      # One table
+      self.tables = None
+      self.table = self._translationTable(tables)
+    else:
+      self.tables = [None if table is None else self._translationTable(table) for table in tables]
+      self.table = None
+
+
+  def _translationTable(self, table):
+    ''' Table as a 256 char string, as for str.translate() '''
+    if isinstance(table, str):
+      assert len(table) == 256
+      return table
+    assert len(table) == 256, "LUT table must have 256 entries."
+    return array("B", table).tostring()
+
+
+  '''
+  Alternate constructors for common adjustments.
+  '''
+  @classmethod
+  def invert(cls):
+    return cls(range(255, -1, -1))
+
+  @classmethod
+  def gamma(cls, gamma):
+    ''' Output = input ** (1/gamma), on the range [0,1].  gamma > 1 lightens. '''
+    return cls([int(round(255.0 * (value / 255.0) ** (1.0 / gamma))) for value in range(0, 256)])
+
+  @classmethod
+  def levels(cls, low, high):
+    ''' Stretch [low, high] to [0, 255], clamping outside. '''
+    assert low < high
+    return cls([min(255, max(0, int(round((value - low) * 255.0 / (high - low))))) for value in range(0, 256)])
+
+  @classmethod
+  def posterize(cls, levelCount):
+    ''' Quantize to levelCount evenly spaced values. '''
+    assert levelCount >= 2
+    step = 255.0 / (levelCount - 1)
+    return cls([int(round(int(round(value / step)) * step)) for value in range(0, 256)])
+
+
+  '''
+  Composition
+  '''
+  def then(self, other):
+    ''' LUT equivalent to applying self, then other. '''
+    if self.tables is None and other.tables is None:
+      return LUT(self.table.translate(other.table))
+    channelCount = len(self.tables) if self.tables is not None else len(other.tables)
+    firsts = self.translationTables(channelCount)
+    seconds = other.translationTables(channelCount)
+    tables = []
+    for first, second in zip(firsts, seconds):
+      if first is None:
+        tables.append(second)
+      elif second is None:
+        tables.append(first)
+      else:
+        # Translating the first table by the second is their composition
+        tables.append(first.translate(second))
+    return LUT(tables)
+
+
+  '''
+  Application
+  '''
+  def translationTables(self, bpp):
+    ''' List of bpp translation tables (strings), None for unchanged channels. '''
+    if self.tables is None:
+      return [self.table] * bpp
+    assert len(self.tables) == bpp, "LUT has a table per channel, for a different count of channels."
+    return self.tables
+
+  def isUniform(self):
+    ''' Is the same table applied to every channel? '''
+    return self.tables is None
+
+
+  def apply(self, values, bpp):
+    '''
+    New array of values (an array of unsigned bytes, interleaved bpp pixelels per pixel) mapped by self.
+    '''
+    if self.isUniform():
+      return array("B", values.tostring().translate(self.table))
+    result = array("B", values)
+    for channel, table in enumerate(self.translationTables(bpp)):
+      if table is not None:
+        result[channel::bpp] = array("B", values[channel::bpp].tostring().translate(table))
+    return result
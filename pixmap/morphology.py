@@ -0,0 +1,209 @@
+'''
+Morphology and blurring of 2D masks stored as 1D arrays of mask values (as in PixmapMask.)
+
+Functions take (values, width, height, ...) where values is an array of width*height mask values (one pixelel per pixel),
+and return a new array of the same dimensions.
+Pixels outside the map are totally masked (0), as for GIMP's grow and shrink of a selection not touching the image edge.
+
+Knows nothing about PixmapMask: see its methods dilate(), erode(), etc.
+
+Bulk: by rows, using map() of builtin operators over whole rows, so the Python loops are per row, never per pixel.
+Vertical passes work on rows; horizontal passes transpose (zip), work on columns as rows, and transpose back.
+
+Square structuring element: running max (min) by the van Herk/Gil-Werman method:
+prefix and suffix maxima within blocks of 2*radius+1 rows, then one max per row,
+so the cost does not depend on the radius.
+Disk structuring element: decomposed into a horizontal run per row offset (of half width sqrt(r*r - dy*dy)),
+so the cost is one square pass per distinct half width and one max per row per row offset: linear in the radius.
+Gaussian: approximated by three box blurs (running sums), whose cost does not depend on the radius.
+
+
+To test:
+cd to the enclosing directory
+python -m doctest -v morphology.py
+
+A 5x5 mask with one selected pixel
+>>> from array import array
+>>> values = array("B", [0] * 25)
+>>> values[12] = 255
+
+>>> show = lambda values: [list(values[row * 5:(row + 1) * 5]) for row in range(0, 5)]
+>>> show(dilate(values, 5, 5, 1))
+[[0, 0, 0, 0, 0], [0, 255, 255, 255, 0], [0, 255, 255, 255, 0], [0, 255, 255, 255, 0], [0, 0, 0, 0, 0]]
+>>> show(dilate(values, 5, 5, 2, 'disk'))
+[[0, 0, 255, 0, 0], [0, 255, 255, 255, 0], [255, 255, 255, 255, 255], [0, 255, 255, 255, 0], [0, 0, 255, 0, 0]]
+>>> erode(dilate(values, 5, 5, 1), 5, 5, 1) == values
+True
+
+Outside is not selected: eroding shrinks from the edges
+>>> show(erode(array("B", [255] * 25), 5, 5, 1))[0:2]
+[[0, 0, 0, 0, 0], [0, 255, 255, 255, 0]]
+
+Border: dilated less eroded
+>>> show(border(dilate(values, 5, 5, 1), 5, 5, 1))[2]
+[255, 255, 0, 255, 255]
+
+Blur spreads values, preserving a uniform mask
+>>> show(gaussianBlur(values, 5, 5, 1.0))[2]
+[9, 15, 17, 15, 9]
+>>> gaussianBlur(array("B", [255] * 25), 5, 5, 3.0) == array("B", [255] * 25)
+True
+'''
+
+from array import array
+from math import sqrt
+from operator import add, sub, floordiv
+
+
+GIMP_TOTALLY_MASKED = 0
+
+
+
+'''
+Morphology.
+'''
+
+def dilate(values, width, height, radius, shape='square'):
+  ''' Max over structuring element (shape 'square' or 'disk') of radius: grow. '''
+  return _filter(values, width, height, radius, shape, max)
+
+def erode(values, width, height, radius, shape='square'):
+  ''' Min over structuring element of radius: shrink. '''
+  return _filter(values, width, height, radius, shape, min)
+
+def opening(values, width, height, radius, shape='square'):
+  ''' Erode then dilate: removes specks and thin parts smaller than the structuring element. '''
+  return dilate(erode(values, width, height, radius, shape), width, height, radius, shape)
+
+def closing(values, width, height, radius, shape='square'):
+  ''' Dilate then erode: fills holes and gaps smaller than the structuring element. '''
+  return erode(dilate(values, width, height, radius, shape), width, height, radius, shape)
+
+def border(values, width, height, radius, shape='square'):
+  ''' Dilated less eroded: a band of width about 2*radius along edges of the mask. '''
+  return array("B", map(sub, dilate(values, width, height, radius, shape), erode(values, width, height, radius, shape)))
+
+
+def _filter(values, width, height, radius, shape, operator):
+  assert radius >= 0
+  assert shape in ('square', 'disk'), "Unknown structuring element: " + str(shape)
+  if radius == 0:
+    return array("B", values)
+  rows = _rowsOf(values, width, height)
+  if shape == 'square':
+    rows = _transposed(_slideRows(_transposed(rows), radius, operator, GIMP_TOTALLY_MASKED))
+    rows = _slideRows(rows, radius, operator, GIMP_TOTALLY_MASKED)
+  else:
+    rows = _diskRows(rows, radius, operator, GIMP_TOTALLY_MASKED)
+  return _valuesOf(rows)
+
+
+def _slideRows(rows, radius, operator, padValue):
+  '''
+  List of rows, each the operator (max or min) of rows in a window of radius around it (van Herk/Gil-Werman.)
+  Rows outside are all padValue.
+  '''
+  size = 2 * radius + 1
+  padRow = [padValue] * len(rows[0])
+  padded = [padRow] * radius + rows + [padRow] * radius
+  # Whole blocks of size rows
+  padded += [padRow] * (-len(padded) % size)
+  count = len(padded)
+  # prefix[i] is operator of rows from start of block to i; suffix[i] from i to end of block
+  prefix = list(padded)
+  for index in range(0, count):
+    if index % size:
+      prefix[index] = map(operator, prefix[index - 1], padded[index])
+  suffix = list(padded)
+  for index in range(count - 2, -1, -1):
+    if (index + 1) % size:
+      suffix[index] = map(operator, suffix[index + 1], padded[index])
+  # The window of row y is padded rows y..y+size-1: a suffix of one block and a prefix of the next
+  return [map(operator, suffix[y], prefix[y + size - 1]) for y in range(0, len(rows))]
+
+
+def _diskRows(rows, radius, operator, padValue):
+  ''' List of rows, each the operator of a disk of radius around each pixel. '''
+  height = len(rows)
+  padRow = [padValue] * len(rows[0])
+  offsetsOfHalfWidth = {}
+  for dy in range(-radius, radius + 1):
+    offsetsOfHalfWidth.setdefault(int(sqrt(radius * radius - dy * dy)), []).append(dy)
+  result = None
+  for halfWidth, offsets in offsetsOfHalfWidth.items():
+    if halfWidth:
+      runs = _transposed(_slideRows(_transposed(rows), halfWidth, operator, padValue))
+    else:
+      runs = rows
+    # Shift by each row offset
+    for dy in offsets:
+      shifted = [runs[y + dy] if 0 <= y + dy < height else padRow for y in range(0, height)]
+      if result is None:
+        result = shifted
+      else:
+        result = [map(operator, resultRow, shiftedRow) for resultRow, shiftedRow in zip(result, shifted)]
+  return result
+
+
+
+'''
+Blurring.
+'''
+
+def boxBlur(values, width, height, radius, passes=1):
+  ''' Mean over a square of radius, passes times.  Edges are extended. '''
+  rows = _rowsOf(values, width, height)
+  for _ in range(0, passes):
+    rows = _transposed(_boxRows(_transposed(rows), radius))
+    rows = _boxRows(rows, radius)
+  return _valuesOf(rows)
+
+def gaussianBlur(values, width, height, sigma):
+  '''
+  Approximately Gaussian blur of standard deviation sigma: three box blurs of about the same variance.
+  Spreads values at most 3 * boxRadius(sigma) pixels.
+  '''
+  radius = boxRadius(sigma)
+  if radius == 0:
+    return array("B", values)
+  return boxBlur(values, width, height, radius, 3)
+
+def boxRadius(sigma):
+  ''' Radius of each of three boxes whose blurs approximate a Gaussian of sigma. '''
+  # Variance of a box of width w is (w*w - 1)/12, three boxes add
+  return int(round((sqrt(4.0 * sigma * sigma + 1) - 1) / 2))
+
+
+def _boxRows(rows, radius):
+  ''' List of rows, each the rounded mean of rows in a window of radius around it, by a running sum. '''
+  size = 2 * radius + 1
+  width = len(rows[0])
+  padded = [rows[0]] * radius + rows + [rows[-1]] * radius
+  halves = [size // 2] * width
+  sizes = [size] * width
+  total = reduce(lambda a, b: map(add, a, b), padded[0:size])
+  result = []
+  for y in range(0, len(rows)):
+    if y:
+      total = map(sub, map(add, total, padded[y + size - 1]), padded[y - 1])
+    result.append(map(floordiv, map(add, total, halves), sizes))
+  return result
+
+
+
+'''
+Rows
+'''
+
+def _rowsOf(values, width, height):
+  return [list(values[y * width:(y + 1) * width]) for y in range(0, height)]
+
+def _valuesOf(rows):
+  result = array("B")
+  for row in rows:
+    result.extend(row)
+  return result
+
+def _transposed(rows):
+  ''' Columns as rows. '''
+  return [list(column) for column in zip(*rows)]
@@ -0,0 +1,194 @@
+
+from coord import Coord
+from pixmapMask import PixmapMask
+from stats import stats
+
+
+class PixelCursor(object):
+  '''
+  A movable position in an ArrayMap (and optionally its selection PixmapMask.)
+
+  For scan order and neighborhood algorithms (error diffusion, dithering, scanline fills.)
+  Holds the flat index of the current pixel and moves by incremental index arithmetic:
+  moving, and reading or writing pixelels at or relative to the position, create no objects.
+
+  Compare to subscripting an ArrayMap by Coord, which multiplies out the index
+  and returns a new array for every access.
+
+  Relative offsets (dx, dy) are in pixels, from the current position.
+
+  !!! Not clipped.  Like subscripting, an index past the end of the map raises IndexError,
+  but a negative index silently wraps (Python arrays.)
+  Use isClipped() when you might move or look outside the map.
+
+  !!! The cursor addresses the map's pixelelArray directly:
+  writes are to the map (not a copy), and the cursor sees the map's later writes.
+
+
+  To test:
+  cd to the enclosing directory
+  python -m doctest -v pixelCursor.py
+
+  >>> from arraymap import ArrayMap
+  >>> from pixmapMask import PixmapMask
+
+  A 3x2 map with 2 pixelels per pixel
+  >>> mask = PixmapMask(3, [0, 255, 128, 0, 0, 0])
+  >>> map = ArrayMap(3, 2, 2, range(12), mask)
+  >>> cursor = PixelCursor(map, Coord(0,0), mask)
+
+  >>> cursor.getPixelel(1)
+  1
+  >>> cursor.moveRight()
+  >>> cursor.coord()
+  Coord(1,0)
+  >>> cursor.getPixelel(0), cursor.getPixelel(0, dx=1), cursor.getPixelel(0, dy=1)
+  (2, 4, 8)
+  >>> cursor.pixel(dx=-1)
+  array('B', [0, 1])
+
+  Selection at the cursor
+  >>> cursor.selectionValue(), cursor.isSomewhatSelected(), cursor.selectionValue(dx=1)
+  (255, True, 128)
+
+  Writes go to the map
+  >>> cursor.moveBy(1, 1)
+  >>> cursor.setPixelel(0, 99)
+  >>> cursor.setPixelel(1, 98, dx=-2)
+  >>> map[Coord(2,1)], map[Coord(0,1)]
+  (array('B', [99, 11]), array('B', [6, 98]))
+  >>> cursor.isSomewhatSelected()
+  False
+
+  Clipping
+  >>> cursor.isClipped(), cursor.isClipped(dx=1), cursor.isClipped(dy=-1)
+  (False, True, False)
+
+  Scan order
+  >>> cursor.moveTo(Coord(2,0))
+  >>> cursor.moveToNext()
+  True
+  >>> cursor.coord()
+  Coord(0,1)
+  >>> cursor.moveTo(Coord(2,1))
+  >>> cursor.moveToNext()
+  False
+  '''
+
+  def __init__(self, map, coord=Coord(0,0), mask=None):
+    '''
+    map is an ArrayMap.
+    mask is optional, usually map.selectionMask(); required only by selection methods.
+    '''
+    self.map = map
+    self.mask = mask
+    if mask is not None:
+      assert mask.width == map.width
+
+    # Cached from map, so moving dereferences only self
+    self.pixelelArray = map.pixelelArray
+    self.width = map.width
+    self.height = map.height
+    self.bpp = map.bpp
+    self.rowStride = map.width * map.bpp  # pixelels per row
+
+    self.moveTo(coord)
+
+
+  '''
+  Responsibility: position.
+
+  Index arithmetic is incremental: self.pixelIndex indexes the mask, self.pixelelIndex indexes the map.
+  '''
+  def moveTo(self, coord):
+    ''' Absolute move. '''
+    self.x = coord.x
+    self.y = coord.y
+    self.pixelIndex = coord.y * self.width + coord.x
+    self.pixelelIndex = self.pixelIndex * self.bpp
+
+  def moveRight(self, count=1):
+    self.x += count
+    self.pixelIndex += count
+    self.pixelelIndex += count * self.bpp
+
+  def moveDown(self, count=1):
+    self.y += count
+    self.pixelIndex += count * self.width
+    self.pixelelIndex += count * self.rowStride
+
+  def moveBy(self, dx, dy):
+    self.x += dx
+    self.y += dy
+    self.pixelIndex += dy * self.width + dx
+    self.pixelelIndex += dy * self.rowStride + dx * self.bpp
+
+  def moveToNext(self):
+    '''
+    Move to next pixel in scan order (right, wrapping to start of next row.)
+    Return False if moved past the last pixel.
+    '''
+    self.x += 1
+    self.pixelIndex += 1
+    self.pixelelIndex += self.bpp
+    if self.x == self.width:
+      self.x = 0
+      self.y += 1
+    return self.y < self.height
+
+  def coord(self):
+    ''' Current position as a new Coord. '''
+    return Coord(self.x, self.y)
+
+  def isClipped(self, dx=0, dy=0):
+    ''' Is the pixel at offset (dx, dy) from the cursor outside the map? '''
+    x = self.x + dx
+    y = self.y + dy
+    return x < 0 or y < 0 or x >= self.width or y >= self.height
+
+
+  '''
+  Responsibility: get/set pixelels at or relative to the position.
+
+  Unlike subscripting an ArrayMap, you CAN assign individual pixelels.
+  '''
+  def getPixelel(self, pixelelIndex, dx=0, dy=0):
+    return self.pixelelArray[self.pixelelIndex + dy * self.rowStride + dx * self.bpp + pixelelIndex]
+
+  def setPixelel(self, pixelelIndex, value, dx=0, dy=0):
+    self.pixelelArray[self.pixelelIndex + dy * self.rowStride + dx * self.bpp + pixelelIndex] = value
+
+  def pixel(self, dx=0, dy=0):
+    ''' Pixel as a new array, as returned by subscripting an ArrayMap. '''
+    index = self.pixelelIndex + dy * self.rowStride + dx * self.bpp
+    return self.pixelelArray[index:index + self.bpp]
+
+  def setPixel(self, value, dx=0, dy=0):
+    ''' Set pixelels from value, an array of bpp ints. '''
+    assert len(value) == self.bpp
+    index = self.pixelelIndex + dy * self.rowStride + dx * self.bpp
+    self.pixelelArray[index:index + self.bpp] = value
+
+
+  '''
+  Responsibility: selection at or relative to the position.
+  '''
+  def selectionValue(self, dx=0, dy=0):
+    ''' Int mask value in GIMP selection semantics. '''
+    return self.mask.pixelelArray[self.pixelIndex + dy * self.width + dx]
+
+  def isSomewhatSelected(self, dx=0, dy=0):
+    ''' Is totally or partially selected. '''
+    return self.mask.pixelelArray[self.pixelIndex + dy * self.width + dx] \
+        != PixmapMask.GIMP_SELECTION_TOTALLY_NOT_SELECTED
+
+
+
+
+" Hot methods counted while stats are enabled.  See stats.py. "
+stats.instrument(PixelCursor, 'getPixelel', 'pixelReads')
+stats.instrument(PixelCursor, 'pixel', 'pixelReads')
+stats.instrument(PixelCursor, 'setPixelel', 'pixelWrites')
+stats.instrument(PixelCursor, 'setPixel', 'pixelWrites')
+stats.instrument(PixelCursor, 'selectionValue', 'maskLookups')
+stats.instrument(PixelCursor, 'isSomewhatSelected', 'maskLookups')
@@ -1,12 +1,30 @@
 '''
 '''
 
+from coord import Coord
+
+
 class PixelelID(object):
   '''
   PixelelID is a 3D coord for a pixelel,
   i.e. 2D coord of pixel within pixmap and 1D index of pixelel within pixel.
   
   A named tuple
+  
+  Convertible to and from a flat index of the pixelel in the pixelel array of a map (of width and bpp),
+  for bulk access (see ArrayMap.getPixelels(), ArrayMap.setPixelels().)
+  
+  
+  To test:
+  cd to the enclosing directory
+  python -m doctest -v pixelelID.py
+  
+  >>> from coord import Coord
+  >>> id = PixelelID(Coord(1,2), 3)
+  >>> id.flatIndex(5, 4)
+  47
+  >>> PixelelID.fromFlatIndex(47, 5, 4)
+  PixelelID(Coord(1,2),3)
   '''
   
   def __init__(self, coord, pixelelIndex):
@@ -21,4 +39,19 @@ class PixelelID(object):
     return "PixelelID(" + str(self.coord) + "," + str(self.pixelelIndex) + ")"
   
   def __eq__(self, other):
-    return self.coord == other.coord and self.pixelelIndex == other.pixelelIndex
\ No newline at end of file
+    return self.coord == other.coord and self.pixelelIndex == other.pixelelIndex
+  
+  
+  '''
+  Flat index: ((y * width) + x) * bpp + pixelelIndex
+  '''
+  def flatIndex(self, width, bpp):
+    ''' Index of self in the pixelel array of a map of width and bpp. '''
+    return (self.coord.y * width + self.coord.x) * bpp + self.pixelelIndex
+  
+  @classmethod
+  def fromFlatIndex(cls, index, width, bpp):
+    ''' Alternate constructor from index in the pixelel array of a map of width and bpp. '''
+    pixelIndex, pixelelIndex = divmod(index, bpp)
+    y, x = divmod(pixelIndex, width)
+    return cls(Coord(x, y), pixelelIndex)
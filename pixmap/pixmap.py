@@ -4,6 +4,8 @@
 from arraymap import ArrayMap
 from pixmapMask import PixmapMask
 from bounds import Bounds
+from stats import stats
+from flushWorker import FlushWorker
 
 
 '''
@@ -23,16 +25,64 @@ class Pixmap(ArrayMap):
   
   Extends ArrayMap by these responsibilities:
   - buffering (initialize from and flush to a Gimp drawable)
+  - asynchronous flushing (flushAsync(), waitFlushed())
+  - undoable flushing through shadow tiles (shadow=True)
   
+  
+  To test (with stand-ins for GIMP's drawable, selection channel and pixel region):
+  cd to the enclosing directory
+  python -m doctest -v pixmap.py
+  
+  >>> class Region(object):
+  ...   bpp = 1
+  ...   def __init__(self, drawable):
+  ...     self.drawable = drawable
+  ...   def __getitem__(self, key):
+  ...     return self.drawable.pixels
+  ...   def __setitem__(self, key, pixels):
+  ...     self.drawable.log.append('write')
+  >>> class Drawable(object):
+  ...   width, height, offsets = 2, 2, (0, 0)
+  ...   def __init__(self):
+  ...     self.pixels = chr(0) * 4
+  ...     self.log = []
+  ...   def get_pixel_rgn(self, x, y, width, height, dirty, shadow):
+  ...     return Region(self)
+  ...   @property
+  ...   def mask_bounds(self):
+  ...     self.log.append('mask_bounds')
+  ...     return (0, 0, 2, 2)
+  ...   def flush(self): pass
+  ...   def merge_shadow(self, undo): self.log.append('merge')
+  ...   def update(self, x, y, width, height): pass
+  >>> class Image(object):
+  ...   selection = Drawable()
+  ...   selection.bpp = 1
+  >>> class TestPixmap(Pixmap):
+  ...   def _selectionBounds(self, image):
+  ...     return (False, 0, 0, 0, 0)
+  >>> drawable = Drawable()
+  >>> drawable.image = Image()
+  
+  Two shadow flushAsync() in a row: GIMP is asked for the merged area once, before any background write.
+  >>> pixmap = TestPixmap(drawable, shadow=True)
+  >>> pixmap.flushAsync()
+  >>> pixmap.flushAsync(Bounds(0,0,0,0))
+  >>> pixmap.waitFlushed()
+  >>> drawable.log[0:2], drawable.log.count('mask_bounds')
+  (['mask_bounds', 'write'], 1)
   '''
   
-  def __init__(self, drawable):
+  def __init__(self, drawable, shadow=False):
     ''' 
     Initialize self from a Gimp drawable. 
     
     Also initialize a PixmapMask for the drawable's selection .
+    
+    If shadow, flushes write through GIMP's shadow tiles and are undoable.  See _flushShadow().
     '''
     # assert isinstance(drawable, gimp.Drawable)
+    startTime = stats.startTimer()
     self.parentDrawable = drawable
     
     '''
@@ -40,23 +90,38 @@ class Pixmap(ArrayMap):
     Create a local copy of Gimp's data (local meaning: access does not read from or write to Gimp, until flushed.)
     '''
     '''
-    Note the parameters for "dirty, shadow" = True, False means that:
-    in flush(), it sets the region dirty and writes directly to the image (not undoable.)
-    Dirty is about undo?
-    Shadow is about double buffering?
-    Here we use neither.
+    Note the parameters for "dirty, shadow" = False, False means that:
+    in flush(), it writes directly to the image (not undoable.)
+    Dirty is about undo: dirtied tiles of the drawable itself.
+    Shadow is about double buffering: writes go to shadow tiles, merged into the drawable (undoably) by merge_shadow.
+    This region uses neither.  It is for reading, and writing when not shadow.
     '''
-    # TODO pass dirty, shadow
     self.region = drawable.get_pixel_rgn(0, 0, drawable.width, drawable.height, False, False)
     # Retain region for later use
     
+    self.useShadow = shadow
+    # Region (dirty, shadow), created on first flush.  Whether written over the merged area yet.
+    self.shadowRegion = None
+    self.isShadowInitialized = False
+    # Merged area (a Bounds), asked of GIMP on first flush
+    self.shadowMergedBounds = None
+    
+    # Created on first flushAsync()
+    self.flushWorker = None
+    # Stats counted by the FlushWorker thread, merged into stats by waitFlushed() (see Stats.merge())
+    self.backgroundCounts = {}
+    
     # Get mask from GIMP first
     mask = self._getSelectionMask(drawable)
     
+    pixels = self.region[0:drawable.width, 0:drawable.height]
+    if stats.isEnabled():
+      stats.count('bytesRead', len(pixels))
+    
     super(Pixmap, self).__init__(width=drawable.width,
                                  height=drawable.height,
                                  bpp=self.region.bpp,
-                                 initializer=self.region[0:drawable.width, 0:drawable.height],
+                                 initializer=pixels,
                                  mask=mask
                                  )
     " Ensure "
@@ -65,14 +130,29 @@ class Pixmap(ArrayMap):
     
     # One selection Pixelel (byte) per Pixel.
     assert len(self.selectionMask()) * self.bpp == len(self.pixelelArray)  
+    stats.stopTimer(startTime, 'inits', 'initSeconds')
   
   
   def flush(self, bounds=None):
     '''
     Ask GIMP to display portion of self (flush buffered changes to Gimp.)
+
+    bounds (default all of self) means, depending on mode:
+    - not shadow: all of self is written, bounds only limits what GIMP displays again
+    - shadow: only bounds is written (after the first flush, which writes all of the merged area.)
+      !!! So bounds must cover every change since the previous flush: changes outside it are never merged.
     '''
+    # Not overtaken by, nor overtake, an earlier flushAsync()
+    self.waitFlushed()
+    if self.useShadow:
+      self._flushShadow(bounds)
+      return
+    startTime = stats.startTimer()
     # Write buffer back to PixelRgn. Convert from integers to string as required by gimp.PixelRgn
-    self.region[0:self.width, 0:self.height] = self.pixelelArray.tostring()
+    pixels = self.pixelelArray.tostring()
+    self.region[0:self.width, 0:self.height] = pixels
+    if stats.isEnabled():
+      stats.count('bytesWritten', len(pixels))
     
     # Canonical steps to make GIMP display updated drawable
     ## merge_shadow only necessary if get_pixel_rgn(..., useShadow=True)
@@ -82,6 +162,7 @@ class Pixmap(ArrayMap):
       bounds = self.bounds()
     # else update only the passed bounds
     self.parentDrawable.update(bounds.ulx, bounds.uly, bounds.width, bounds.height)
+    stats.stopTimer(startTime, 'flushes', 'flushSeconds')
     
     '''
     Don't gimp.displays_flush() because that depends on PyGIMP.
@@ -96,58 +177,191 @@ class Pixmap(ArrayMap):
     # bounds of entire drawable
     bounds = Bounds.initFromGIMPBounds(0, 0, self.parentDrawable.width, self.parentDrawable.height)
     self.flush(bounds)
+  
+  
+  def flushAsync(self, bounds=None):
+    '''
+    Flush bounds of self (default all of self) in the background, and return without waiting.
     
+    For progressive preview: continue computing on self while the flush is written.
+    Takes a snapshot of bounds of self now, so later writes to self are not flushed.
+    In any mode only bounds is written: bounds must cover every change since the previous flush.
+    A flushAsync() while an earlier one is not yet written is coalesced with it.
     
+    !!! Caller must call waitFlushed() before further use of the drawable (e.g. gimp.displays_flush())
+    and before returning to GIMP.
+    The background thread is the only user of GIMP until then: PyGIMP is not thread safe.
+    '''
+    if bounds is None:
+      bounds = Bounds.initFromGIMPBounds(0, 0, self.width, self.height)
+    if self.useShadow:
+      bounds = self._shadowFlushBounds(bounds)
+      if bounds is None:
+        return
+    if self.flushWorker is None:
+      write = self._writeShadowRect if self.useShadow else self._writeRect
+      def writeInBackground(bounds, pixels):
+        write(bounds, pixels, self.backgroundCounts)
+      self.flushWorker = FlushWorker(writeInBackground)
+    self.flushWorker.submit(bounds, self.rectString)
   
-  def _getSelectionMask(self, drawable):
-    ''' 
-    Drawable's selection mask as a PixmapMask. 
+  
+  def waitFlushed(self):
+    '''
+    Barrier: return when all flushAsync() are written to GIMP.
+    Raises any exception raised while writing in the background.
+    '''
+    if self.flushWorker is not None:
+      try:
+        self.flushWorker.wait()
+      finally:
+        # The worker thread is done: no race on counters
+        stats.merge(self.backgroundCounts)
+  
+  
+  def _writeRect(self, bounds, pixels, counts=None):
+    '''
+    Write string pixels of bounds to GIMP, and ask GIMP to display it.  In the background.
+    counts: dict that stats are counted into, see Stats.count().
+    '''
+    startTime = stats.startTimer()
+    self.region[bounds.ulx:bounds.lrx + 1, bounds.uly:bounds.lry + 1] = pixels
+    if stats.isEnabled():
+      stats.count('bytesWritten', len(pixels), counts)
+    self.parentDrawable.update(bounds.ulx, bounds.uly, bounds.width, bounds.height)
+    stats.stopTimer(startTime, 'flushes', 'flushSeconds', counts)
+  
+  
+  '''
+  Responsibility: undoable flushing through shadow tiles.
+  
+  GIMP merges shadow tiles into the drawable over the intersection of the drawable with the selection
+  (the "merged area", through the selection mask), pushing an undo step.
+  The shadow tiles persist between merges, until the plugin frees them or returns to GIMP.
+  So the first flush writes all of the merged area, and later flushes write only the changed bounds:
+  the rest of the shadow already equals self.
+  The cost of a flush (other than GIMP's merge) is proportional to the changed area, not the drawable.
+  '''
+  def _flushShadow(self, bounds):
+    ''' Flush changed bounds (default all of self) through the shadow tiles. '''
+    if bounds is None:
+      bounds = Bounds.initFromGIMPBounds(0, 0, self.width, self.height)
+    bounds = self._shadowFlushBounds(bounds)
+    if bounds is not None:
+      self._writeShadowRect(bounds, self.rectString(bounds))
+  
+  
+  def _shadowFlushBounds(self, bounds):
+    '''
+    Bounds to write to the shadow, given changed bounds.  None if changes are outside the merged area.
+    
+    Asks GIMP for the merged area only once, on the first flush, while no flush is in the background:
+    later (e.g. a flushAsync() while a FlushWorker writes) GIMP must not be called from this thread.
+    So the selection must not change while self is flushed.
+    '''
+    if self.shadowMergedBounds is None:
+      self.shadowMergedBounds = Bounds.initFromGIMPBounds(*self.parentDrawable.mask_bounds)
+    if not self.isShadowInitialized:
+      self.isShadowInitialized = True
+      return self.shadowMergedBounds
+    return bounds.intersect(self.shadowMergedBounds)
+  
+  
+  def _writeShadowRect(self, bounds, pixels, counts=None):
+    '''
+    Write string pixels of bounds to shadow tiles, merge (undoably), and ask GIMP to display bounds.
+    counts: as for _writeRect().
+    '''
+    startTime = stats.startTimer()
+    if self.shadowRegion is None:
+      self.shadowRegion = self.parentDrawable.get_pixel_rgn(0, 0, self.width, self.height, True, True)
+    self.shadowRegion[bounds.ulx:bounds.lrx + 1, bounds.uly:bounds.lry + 1] = pixels
+    if stats.isEnabled():
+      stats.count('bytesWritten', len(pixels), counts)
+    # Canonical steps: push tiles to GIMP, merge shadow into drawable with undo, update display
+    self.parentDrawable.flush()
+    self.parentDrawable.merge_shadow(True)
+    self.parentDrawable.update(bounds.ulx, bounds.uly, bounds.width, bounds.height)
+    stats.stopTimer(startTime, 'flushes', 'flushSeconds', counts)
     
+    
+  
+  def _getSelectionMask(self, drawable):
+    '''
+    Drawable's selection mask as a PixmapMask.
+
     !!! This is called before self's base class is initialized,
     so certain attributes of self are not known yet: use attributes from drawable.
+
+    Lazy, and limited to the bounds of the selection.
+    Ask GIMP for the selection bounds first, then:
+    - no selection (or none over the drawable): a constant mask, not allocated
+    - else: read only the selection's bounding rect (clipped to the drawable) into a window mask.
     '''
     image = drawable.image
     selection = image.selection # returns a channel
-    print("Selection channel, width, height", selection, selection.width, selection.height)
+    stats.log("Selection channel, width, height", selection, selection.width, selection.height)
     assert selection.bpp == 1
-    '''
-    Get region for selection channel
-    F, F : read only, and not need a shadow
-    '''
-    selectionRgn = selection.get_pixel_rgn(0, 0, selection.width, selection.height, False, False)
-    print("Selection region, x, y, width, height", selectionRgn.x, selectionRgn.y, selectionRgn.w, selectionRgn.h)
-    print("First pixel of selection region", str(ord(selectionRgn[0,0])))
-    '''
-    Note that many selections (especially grown selections) might have rounded corners
-    and thus have 0 for the first pixel, which may be unexpected to casual glance.
-    '''
-    
+
+    width = drawable.width
+    height = drawable.height
     '''
     Selection channel covers entire image (?)
     Drawable may be offset within image and thus within selection channel.
+    Note the selection channel is never offset from the image (has same origin.)
+
+    Selection bounds are in image coords: translate to drawable coords, and clip to drawable.
+    Thus, we can use same coords in selectionPixmapMask as we use in the drawable pixelelArray
+    (but the index arithmetic different.)
     '''
     offsets = drawable.offsets
-    print("Channel offsets", selection.offsets)
-    print("Drawable offsets, width, height", drawable.offsets, drawable.width, drawable.height)
+    stats.log("Drawable offsets, width, height", offsets, width, height)
+    isSelection, x1, y1, x2, y2 = self._selectionBounds(image)
+    stats.log("Selection GIMP bounds", isSelection, x1, y1, x2, y2)
+    ulx = max(x1 - offsets[0], 0)
+    uly = max(y1 - offsets[1], 0)
+    lrx = min(x2 - offsets[0], width)   # GIMP notion of LR: outside
+    lry = min(y2 - offsets[1], height)
+
+    if not isSelection or ulx >= lrx or uly >= lry:
+      # Same values as reading the selection channel, without reading or allocating.
+      return PixmapMask.initConstant(width, height, PixmapMask.GIMP_SELECTION_TOTALLY_NOT_SELECTED)
+
+    window = Bounds.initFromGIMPBounds(ulx, uly, lrx, lry)
     '''
-    Read selection mask into array, but only size of drawable, and offset.
-    Thus, we can use same coords in selectionPixmapMask as we use in the drawable pixelelArray
-    (but the index arithmetic different.)
-    Note the selection channel is never offset from the image (has same origin.)
-    The drawable is offset within the selection channel.
+    Get region for selection channel, only the window.
+    F, F : read only, and not need a shadow
+    Note a region is subscripted in the coords of its channel.
     '''
-    width = drawable.width
-    height = drawable.height
-    print("Selection array w,h", width, height)
-    selectionPixmapMask = PixmapMask(width=drawable.width, 
-                                     initializer=selectionRgn[offsets[0]:offsets[0]+width,
-                                                       offsets[1]:offsets[1]+height])                                      
-    print("Size of selection channel is ", len(selectionPixmapMask))
+    selectionRgn = selection.get_pixel_rgn(ulx + offsets[0], uly + offsets[1], window.width, window.height,
+                                           False, False)
+    selectionPixels = selectionRgn[ulx + offsets[0]:lrx + offsets[0], uly + offsets[1]:lry + offsets[1]]
+    if stats.isEnabled():
+      stats.count('bytesRead', len(selectionPixels))
+    selectionPixmapMask = PixmapMask.initWindow(width, height, window, selectionPixels)
+    stats.log("Selection window", window)
+
+    if (ulx, uly, lrx, lry) == (x1 - offsets[0], y1 - offsets[1], x2 - offsets[0], y2 - offsets[1]):
+      '''
+      Selection not clipped by drawable: GIMP's bounds are the bounds of somewhat selected pixels.
+      Seed the cache.  Otherwise it is computed on demand, scanning only the window.
+      '''
+      selectionPixmapMask.seedUnmaskedBounds((window.ulx, window.uly, window.lrx, window.lry))
     # selectionPixmapMask.dump()
     return selectionPixmapMask
-  
-  
-  
+
+
+  def _selectionBounds(self, image):
+    '''
+    Tuple (isSelection, x1, y1, x2, y2) of image's selection: GIMP notion of bounds, in image coords.
+
+    Import PyGIMP here, not at module level, so this module imports without GIMP.
+    '''
+    from gimp import pdb
+    return pdb.gimp_selection_bounds(image)
+
+
+
 """
 CRUFT
   
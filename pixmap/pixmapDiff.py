@@ -0,0 +1,119 @@
+
+import re
+from array import array
+from operator import sub, or_
+
+from bounds import Bounds
+from pixmapMask import PixmapMask
+
+
+" Translation table: 0 to 0 (unchanged), else 255 (changed) "
+_CHANGED_TABLE = chr(0) + chr(255) * 255
+_CHANGED_RUN = re.compile(chr(255) + "+")
+
+
+class PixmapDiff(object):
+  '''
+  Differences between two ArrayMaps of the same dimensions, before and after (e.g. an operation.)
+
+  Knows:
+  - bounds: Bounds of changed pixels, or None if none changed
+  - mask: PixmapMask of changed pixels (GIMP_SELECTION_TOTALLY_SELECTED where any pixelel changed, else 0)
+  - maxError: list, per channel, of the max absolute difference of pixelels
+  - meanError: list, per channel, of the mean absolute difference of pixelels (over all pixels)
+  - spans: list of changed runs in rows (y, startX, endX) with endX exclusive, or None if not asked for
+
+  E.g. Pixmap.flush(diff.bounds) flushes only what changed.
+
+  Bulk: unchanged rows are skipped by comparing buffers of rows (no copy),
+  and changed rows are differenced by map() of builtin operators.
+
+  See ArrayMap.diff().
+
+
+  To test:
+  cd to the enclosing directory
+  python -m doctest -v pixmapDiff.py
+
+  >>> from arraymap import ArrayMap
+  >>> before = ArrayMap(3, 2, 2, [0] * 12, PixmapMask(3, [0] * 6))
+  >>> after = ArrayMap(3, 2, 2, [0, 0, 0, 0, 0, 0,  0, 9, 0, 0, 4, 4], PixmapMask(3, [0] * 6))
+  >>> diff = PixmapDiff(before, after, spans=True)
+  >>> diff.isEqual()
+  False
+  >>> diff.bounds
+  Bounds(0,1,2,1)
+  >>> list(diff.mask.pixelelArray)
+  [0, 0, 0, 255, 0, 255]
+  >>> diff.maxError, diff.meanError
+  ([4, 9], [0.6666666666666666, 2.1666666666666665])
+  >>> diff.spans
+  [(1, 0, 1), (1, 2, 3)]
+
+  >>> same = PixmapDiff(before, before)
+  >>> same.isEqual(), same.bounds, same.maxError, same.spans
+  (True, None, [0, 0], None)
+  >>> same.mask.isTotalMask()
+  True
+
+  Equality only (no diff): maps of other dimensions are not equal, even with the same pixelels
+  >>> mapsAreEqual(before, ArrayMap(3, 2, 2, [0] * 12, PixmapMask(3, [0] * 6)))
+  True
+  >>> mapsAreEqual(before, ArrayMap(2, 3, 2, [0] * 12, PixmapMask(2, [0] * 6)))
+  False
+  '''
+
+  def __init__(self, before, after, spans=False):
+    ''' spans: whether to compute changed runs of rows. '''
+    assert before.width == after.width and before.height == after.height and before.bpp == after.bpp, "Maps differ in size."
+    width = before.width
+    height = before.height
+    bpp = before.bpp
+    rowLength = width * bpp
+
+    self.bounds = None
+    self.maxError = [0] * bpp
+    self.spans = [] if spans else None
+    errorSums = [0] * bpp
+
+    if mapsAreEqual(before, after):
+      self.mask = PixmapMask.initConstant(width, height, PixmapMask.GIMP_TOTALLY_MASKED)
+    else:
+      maskValues = array("B", chr(PixmapMask.GIMP_TOTALLY_MASKED) * (width * height))
+      values = before.pixelelArray
+      otherValues = after.pixelelArray
+      for y in range(0, height):
+        start = y * rowLength
+        if buffer(values, start, rowLength) == buffer(otherValues, start, rowLength):
+          continue
+        errors = map(abs, map(sub, values[start:start + rowLength], otherValues[start:start + rowLength]))
+        channelErrors = [errors[channel::bpp] for channel in range(0, bpp)]
+        for channel in range(0, bpp):
+          self.maxError[channel] = max(self.maxError[channel], max(channelErrors[channel]))
+          errorSums[channel] += sum(channelErrors[channel])
+        # Changed if any channel changed
+        changed = reduce(lambda a, b: map(or_, a, b), channelErrors)
+        row = array("B", changed).tostring().translate(_CHANGED_TABLE)
+        maskValues[y * width:(y + 1) * width] = array("B", row)
+        if spans:
+          self.spans.extend([(y, run.start(), run.end()) for run in _CHANGED_RUN.finditer(row)])
+      self.mask = PixmapMask(width, maskValues, height)
+      self.bounds = Bounds(*self.mask.computeUnmaskedBounds())
+
+    self.meanError = [errorSum / float(width * height) for errorSum in errorSums]
+
+
+  def isEqual(self):
+    ''' Did no pixel change? '''
+    return self.bounds is None
+
+
+
+def mapsAreEqual(before, after):
+  '''
+  Are maps of equal dimensions and pixelels?
+
+  Stops at the first difference: compares buffers (memory, no copy, no per pixelel objects.)
+  '''
+  return (before.width == after.width and before.height == after.height and before.bpp == after.bpp
+          and buffer(before.pixelelArray) == buffer(after.pixelelArray))
@@ -1,8 +1,17 @@
 
 from sys import maxsize   # maximal int
+from math import log, sqrt
+from random import Random
 from array import array
 
+from bounds import Bounds
 from coord import Coord
+from stats import stats
+import transforms
+import regions
+import morphology
+from selectionSampler import SelectionSampler
+from selectionBoundary import SelectionBoundary
 
 
 class PixmapMask(object):
@@ -117,6 +126,77 @@ class PixmapMask(object):
   ...
   AssertionError: Illegal bounds.
   
+  
+  Lazy masks: not allocated until subscripted.
+  
+  >>> from bounds import Bounds
+  >>> c = PixmapMask.initConstant(3, 2, 0)
+  >>> len(c), c.height, c.isLazy(), c.isTotalMask()
+  (6, 2, True, True)
+  >>> c[Coord(2,1)]
+  0
+  >>> c.isLazy()
+  False
+  
+  Window mask: initializer gives values inside a window, elsewhere totally masked.
+  >>> w = PixmapMask.initWindow(3, 3, Bounds(1,1,2,1), [0, 7])
+  >>> w.isTotalMask()
+  False
+  >>> w.computeUnmaskedBounds()
+  (2, 1, 2, 1)
+  >>> w.isLazy()
+  True
+  >>> list(w.pixelelArray)
+  [0, 0, 0, 0, 0, 7, 0, 0, 0]
+  
+  Mutation invalidates the unmasked bounds.
+  >>> w[Coord(0,0)] = 255
+  >>> w.computeUnmaskedBounds()
+  (0, 0, 2, 1)
+  
+  Regions
+  >>> islands = PixmapMask(4, [255, 0, 0, 0,  255, 0, 128, 130,  0, 0, 0, 0])
+  >>> region, bounds = islands.floodFill(Coord(3,1), tolerance=2)
+  >>> bounds, region.unmaskedBounds()
+  (Bounds(2,1,3,1), (2, 1, 3, 1))
+  >>> components = islands.labelComponents()
+  >>> components.count(), components.bounds[1:]
+  (2, [Bounds(0,0,0,1), Bounds(2,1,3,1)])
+  
+  Random selected pixels, by a sampler cached until mutation
+  >>> sorted(set(islands.randomSelectedIndices(50, seed=1)))
+  [0, 4, 6, 7]
+  >>> sampler = islands.selectionSampler()
+  >>> sampler is islands.selectionSampler()
+  True
+  >>> islands[Coord(1,0)] = 255
+  >>> islands.selectionSampler() is sampler
+  False
+  >>> islands[Coord(1,0)] = 0
+
+  Boundary of the selection, updated incrementally by setPixelels()
+  >>> grown = PixmapMask(3, [255] * 6 + [0] * 3)
+  >>> grown.boundaryIndices()
+  array('l', [0, 1, 2, 3, 4, 5])
+  >>> grown.setPixelels([6, 7, 8], [255] * 3)
+  >>> grown.boundaryIndices()
+  array('l', [0, 1, 2, 3, 5, 6, 7, 8])
+  >>> grown.boundaryContours()
+  [[0, 1, 2, 5, 8, 7, 6, 3]]
+  >>> list(grown.boundaryMask().pixelelArray) == [255] * 4 + [0] + [255] * 4
+  True
+
+  Morphology, in place, updating unmasked bounds
+  >>> islands.dilate(1)
+  >>> islands.unmaskedBounds()
+  (0, 0, 3, 2)
+  >>> islands.erode(1)
+  >>> list(islands.pixelelArray)
+  [0, 0, 0, 0, 0, 130, 130, 0, 0, 0, 0, 0]
+  >>> islands.feather(3)
+  >>> islands.unmaskedBounds()
+  (0, 0, 3, 2)
+  
   '''
   
   # Same values that Gimp uses, here as class attributes
@@ -127,14 +207,21 @@ class PixmapMask(object):
   GIMP_SELECTION_TOTALLY_SELECTED = 255
 
 
-  def __init__(self, width, initializer, height=None):
-    ''' Initializer is iteratable. '''
-    self.pixelelArray = array("B", initializer)
+  def __init__(self, width, initializer, height=None, copy=True):
+    '''
+    Initializer is iteratable.
+    If not copy, and initializer is an array of mask values, self adopts it.
+    '''
+    if isinstance(initializer, array) and initializer.typecode == "B":
+      # A copy by slicing: much faster than array() which iterates over another array
+      self.pixelelArray = initializer[:] if copy else initializer
+    else:
+      self.pixelelArray = array("B", initializer)
+    self._lazyInitializer = None  # see initConstant(), initWindow()
     self.width = width  # needed for address arithemetic
     
-    # cached.  None means not computed yet.  A tuple, not a Bounds.
-    # !!! Currently not updated when you change a mask value.
-    self.unmaskedBoundsCache = None
+    # Caches, see _invalidateCaches()
+    self._invalidateCaches()
     
     # Compute height.
     self.height = len(self.pixelelArray) / self.width
@@ -146,8 +233,100 @@ class PixmapMask(object):
       
   
   
+  def _invalidateCaches(self):
+    '''
+    Forget everything cached about mask values: call after every mutation.
+    
+    Caches (None means not computed yet):
+    - unmaskedBoundsCache: a tuple, not a Bounds
+    - selectionSamplerCache: a SelectionSampler
+    - selectionBoundaryCache: a SelectionBoundary
+    
+    _hasCaches: whether any cache may be computed, so subscript assignment (a hot path) can skip invalidating.
+    Whatever fills a cache sets it.
+    
+    Mutators (subscript assignment, invert(), morphology, setPixelels()) call this.
+    !!! Other writes to pixelelArray must call it too.
+    '''
+    self.unmaskedBoundsCache = None
+    self.selectionSamplerCache = None
+    self.selectionBoundaryCache = None
+    self._hasCaches = False
+  
+  
+  '''
+  Lazy initialization.
+  
+  A lazy mask does not allocate pixelelArray until the first access to it (usually by subscripting.)
+  Until then, it knows its values from a constant and an optional window of values.
+  Properties (len, isTotalMask, computeUnmaskedBounds) do not allocate.
+  '''
+  @classmethod
+  def initConstant(cls, width, height, value):
+    ''' Alternate constructor: lazy mask, every value equal to value. '''
+    return cls._initLazy(width, height, value, None, None)
+  
+  @classmethod
+  def initWindow(cls, width, height, window, initializer, value=GIMP_TOTALLY_MASKED):
+    '''
+    Alternate constructor: lazy mask, values from initializer inside window, else equal to value.
+    
+    window is a Bounds (our notion of bounds) inside width, height.
+    initializer is a string or sequence of window.width * window.height ints, in row order.
+    '''
+    assert window.ulx >= 0 and window.uly >= 0 and window.lrx < width and window.lry < height, "Illegal bounds."
+    assert len(initializer) == window.width * window.height
+    return cls._initLazy(width, height, value, window, initializer)
+  
+  @classmethod
+  def _initLazy(cls, width, height, value, window, initializer):
+    mask = cls.__new__(cls)
+    mask.width = width
+    mask.height = height
+    mask._invalidateCaches()
+    mask._lazyInitializer = (value, window, initializer)
+    return mask
+  
+  @classmethod
+  def initRegion(cls, width, height, values, bounds):
+    '''
+    Alternate constructor: mask of values, whose unmasked bounds are already known
+    (a tuple, or None for a total mask), e.g. from a flood fill.
+    '''
+    mask = cls(width, values, height)
+    mask.seedUnmaskedBounds(bounds)
+    return mask
+  
+  def isLazy(self):
+    ''' Is pixelelArray not allocated yet? '''
+    return self._lazyInitializer is not None
+  
+  def __getattr__(self, name):
+    '''
+    Called only for attributes not found: allocate pixelelArray of a lazy mask.
+    
+    Thereafter, pixelelArray is an ordinary attribute, without overhead.
+    '''
+    if name == 'pixelelArray' and self.__dict__.get('_lazyInitializer') is not None:
+      self._materialize()
+      return self.pixelelArray
+    raise AttributeError(name)
+  
+  def _materialize(self):
+    value, window, initializer = self._lazyInitializer
+    pixelelArray = array("B", chr(value) * (self.width * self.height))
+    if window is not None:
+      windowArray = array("B", initializer)
+      for row in range(0, window.height):
+        start = (window.uly + row) * self.width + window.ulx
+        pixelelArray[start:start + window.width] = windowArray[row * window.width:(row + 1) * window.width]
+    self.pixelelArray = pixelelArray
+    self._lazyInitializer = None
+  
+  
+  
   def __len__(self):
-    return len(self.pixelelArray)
+    return self.width * self.height
   
   
   ''' Subscripting '''
@@ -180,10 +359,19 @@ class PixmapMask(object):
     Are any pixels fully or partially unmasked? 
     Under interpretation of selection: is there a selection? 
     '''
-    for pixelel in self.pixelelArray:
-      if self.maskValueIsUnmasked(pixelel):
-        return False # some pixel is unmasked to some extent
-    return True  # all pixels are totally masked
+    if self.isLazy():
+      value, window, initializer = self._lazyInitializer
+      if window is None or (window.width * window.height < len(self)):
+        # Some pixels have the constant value
+        if self.maskValueIsUnmasked(value):
+          return False
+      if window is None:
+        return True
+      values = array("B", initializer)
+    else:
+      values = self.pixelelArray
+    # All pixels are totally masked
+    return values.count(PixmapMask.GIMP_TOTALLY_MASKED) == len(values)
   
   
   def dump(self):
@@ -196,6 +384,7 @@ class PixmapMask(object):
     '''
     Invert self.
     '''
+    self._invalidateCaches()
     for pixelelIndex in range(0, len(self)):
       self.pixelelArray[pixelelIndex] = 255 - self.pixelelArray[pixelelIndex]
     # assert every pixelel still in range [0,255]
@@ -208,7 +397,7 @@ class PixmapMask(object):
   
   def getInitializedCopy(self, value):
     ''' Mask initialized to value. '''
-    return PixmapMask(width=self.width, initializer=[value for _ in range(0, len(self.pixelelArray))])
+    return PixmapMask.initConstant(self.width, self.height, value)
   
   '''
   Assuming self is a selection mask, methods for determining selection
@@ -252,8 +441,180 @@ class PixmapMask(object):
     assert value >= 0 and value <= 255
     assert isinstance(pixelIndex, int) and pixelIndex >= 0, str(pixelIndex)
     self.pixelelArray[pixelIndex] = value
+    if self._hasCaches:
+      self._invalidateCaches()
+
+
+  '''
+  Responsibility: geometric transforms.
+
+  Return a new PixmapMask, whose dimensions may differ.  See transforms.py.
+  '''
+  def crop(self, bounds):
+    return self._transformed(transforms.crop, bounds)
+
+  def flipH(self):
+    return self._transformed(transforms.flipH)
+
+  def flipV(self):
+    return self._transformed(transforms.flipV)
+
+  def transpose(self):
+    return self._transformed(transforms.transpose)
+
+  def rotate90(self, turns=1):
+    ''' Rotate by turns quarter turns clockwise. '''
+    return self._transformed(transforms.rotate90, turns)
+
+  def resize(self, width, height, method='nearest'):
+    ''' Resample.  method is 'nearest', 'bilinear' or 'box'. '''
+    return self._transformed(transforms.resize, width, height, method)
 
+  def _transformed(self, transform, *args):
+    values, width, height = transform(self.pixelelArray, self.width, self.height, 1, *args)
+    return PixmapMask(width=width, initializer=values, height=height)
 
+
+
+  '''
+  Responsibility: regions.  See regions.py.
+  '''
+  def floodFill(self, seed, tolerance=0, connectivity=4):
+    '''
+    Region of pixels connected to seed (a Coord) whose values differ from seed's by at most tolerance.
+    
+    Returns tuple (PixmapMask, Bounds) of the region.
+    connectivity is 4 (edge neighbors) or 8 (also diagonal neighbors.)
+    '''
+    match = regions.matchOfPixels(self.pixelelArray, 1, (self[seed],), tolerance)
+    values, bounds = regions.floodFill(match, self.width, self.height, seed.y * self.width + seed.x, connectivity)
+    return PixmapMask.initRegion(self.width, self.height, values, bounds), Bounds(*bounds)
+  
+  def labelComponents(self, connectivity=4):
+    ''' regions.Components (labels, counts, bounds) of connected somewhat selected pixels. '''
+    return regions.labelComponents(regions.matchOfMask(self.pixelelArray), self.width, self.height, connectivity)
+  
+  
+  '''
+  Responsibility: random sampling of selected pixels.  See SelectionSampler.
+  '''
+  def selectionSampler(self):
+    ''' SelectionSampler of self's somewhat selected pixels, cached until self is mutated. '''
+    if self.selectionSamplerCache is None:
+      self.selectionSamplerCache = SelectionSampler(self.pixelelArray, self.width, self.height, self.unmaskedBoundsCache)
+      self._hasCaches = True
+    return self.selectionSamplerCache
+  
+  def randomSelectedIndices(self, count, weighted=False, seed=None):
+    '''
+    List of count flat indices (y * width + x) of random somewhat selected pixels, with replacement.
+    weighted: probability proportional to mask value, else uniform.
+    seed: of the random generator, for repeatable samples (default: seeded by the system.)
+    Raises ValueError if no pixel is selected.
+    '''
+    return self.selectionSampler().sample(count, weighted, Random(seed))
+  
+  
+  '''
+  Responsibility: boundary of the selection.  See SelectionBoundary.
+  
+  Somewhat selected pixels with a not selected 8-neighbor (outside the mask is not selected.)
+  '''
+  def selectionBoundary(self):
+    ''' SelectionBoundary of self, cached until self is mutated (except by setPixelels(), which updates it.) '''
+    if self.selectionBoundaryCache is None:
+      self.selectionBoundaryCache = SelectionBoundary(self.pixelelArray, self.width, self.height, self.unmaskedBoundsCache)
+      self._hasCaches = True
+    return self.selectionBoundaryCache
+  
+  def boundaryIndices(self):
+    ''' Array of flat indices (y * width + x) of boundary pixels, in row order. '''
+    return self.selectionBoundary().indices()
+  
+  def boundaryMask(self):
+    ''' PixmapMask whose boundary pixels are totally selected, others totally not selected. '''
+    return PixmapMask(self.width, self.selectionBoundary().maskValues(), self.height)
+  
+  def boundaryContours(self):
+    ''' List of contours (outer and of holes), each a list of flat indices of boundary pixels in clockwise order. '''
+    return self.selectionBoundary().contours()
+  
+  def setPixelels(self, indices, values):
+    '''
+    Set mask values at flat indices (e.g. pixels added by region growing), in bulk.
+    
+    A cached SelectionBoundary is updated incrementally, only around indices, instead of being recomputed.
+    '''
+    map(self.pixelelArray.__setitem__, indices, values)
+    boundary = self.selectionBoundaryCache
+    self._invalidateCaches()
+    if boundary is not None:
+      boundary.update(indices)
+      self.selectionBoundaryCache = boundary
+      self._hasCaches = True
+  
+  
+  '''
+  Responsibility: morphology.  See morphology.py.
+  
+  In place.  Only the rect of unmasked bounds, expanded by how far the operation spreads, is processed.
+  Updates the unmasked bounds.
+  shape of structuring element is 'square' (cost independent of radius) or 'disk'.
+  Outside the mask is totally masked.
+  '''
+  def dilate(self, radius, shape='square'):
+    ''' Grow selection by radius. '''
+    self._filterUnmasked(radius, morphology.dilate, radius, shape)
+  
+  def erode(self, radius, shape='square'):
+    ''' Shrink selection by radius. '''
+    self._filterUnmasked(0, morphology.erode, radius, shape)
+  
+  def open(self, radius, shape='square'):
+    ''' Remove parts of selection smaller than the structuring element. '''
+    self._filterUnmasked(0, morphology.opening, radius, shape)
+  
+  def close(self, radius, shape='square'):
+    ''' Fill holes in selection smaller than the structuring element. '''
+    self._filterUnmasked(radius, morphology.closing, radius, shape)
+  
+  def border(self, radius, shape='square'):
+    ''' Selection of a band along edges of the selection (as GIMP's Select>Border.) '''
+    self._filterUnmasked(radius, morphology.border, radius, shape)
+  
+  def feather(self, radius):
+    '''
+    Blur selection (as GIMP's Select>Feather): approximately Gaussian,
+    radius as in GIMP (where the Gaussian falls to 1/255), i.e. sigma = radius / sqrt(2 ln 255).
+    '''
+    sigma = radius / sqrt(2 * log(255))
+    self._filterUnmasked(3 * morphology.boxRadius(sigma), morphology.gaussianBlur, sigma)
+  
+  
+  def _filterUnmasked(self, margin, filter, *args):
+    '''
+    Replace the rect of unmasked bounds expanded by margin with filter(values, width, height, *args) of it.
+    
+    Outside the rect, values are totally masked, and remain so when the rect covers all that filter changes.
+    '''
+    if self.isTotalMask():
+      return
+    if self.unmaskedBoundsCache is None:
+      self.computeUnmaskedBounds()
+    ulx, uly, lrx, lry = self.unmaskedBoundsCache
+    rect = Bounds(max(0, ulx - margin), max(0, uly - margin),
+                  min(self.width - 1, lrx + margin), min(self.height - 1, lry + margin))
+    values, width, height = transforms.crop(self.pixelelArray, self.width, self.height, 1, rect)
+    values = filter(values, width, height, *args)
+    for row in range(0, height):
+      start = (rect.uly + row) * self.width + rect.ulx
+      self.pixelelArray[start:start + width] = values[row * width:(row + 1) * width]
+    bounds = self._unmaskedBoundsOfRows(values.tostring(), width, height)
+    if bounds is not None:
+      bounds = (bounds[0] + rect.ulx, bounds[1] + rect.uly, bounds[2] + rect.ulx, bounds[3] + rect.uly)
+    self._invalidateCaches()
+    self.seedUnmaskedBounds(bounds)
+  
   
   '''
   Know bounds
@@ -292,34 +653,75 @@ class PixmapMask(object):
     You should comment this assertion out if you really expect this method be fast.
     '''
     assert bounds == self.computeUnmaskedBounds(), "Passed bounds do not equal computed unmasked bounds."
+    self.seedUnmaskedBounds(bounds)
+  
+  
+  def seedUnmaskedBounds(self, bounds):
+    '''
+    Cache unmasked bounds (a tuple, or None for a total mask) known elsewhere, e.g. from GIMP or a file.
+    
+    Unlike setUnmaskedBounds(), without checking them: they must be correct.
+    '''
     self.unmaskedBoundsCache = bounds
+    self._hasCaches = True
   
   
   def computeUnmaskedBounds(self):
     ''' 
     Compute and cache unmasked bounds.
     
-    Standard algorithm: iterate, computing new max and min x, y
+    Standard algorithm: iterate, computing new max and min x, y.
+    But iterate over rows (as strings, stripping totally masked values), not pixels.
+    For a lazy mask that is totally masked outside a window, iterate only over the window.
     '''
-    ulx = maxsize # initially very large
-    uly = maxsize
-    lrx = 0
-    lry = 0
-    for y in range(0, self.height):
-      for x in range(0, self.width):
-        coords = Coord(x,y)
-        if self.isSomewhatUnmasked(coords):
-          if x < ulx: ulx = x # ul moves left or upper
-          if y < uly: uly = y
-          if x > lrx: lrx = x # lr moves lower or right
-          if y > lry: lry = y
-    if lrx < ulx or lry < uly:
+    if self.isLazy() and not self.maskValueIsUnmasked(self._lazyInitializer[0]):
+      _, window, initializer = self._lazyInitializer
+      if window is None:
+        bounds = None
+      else:
+        bounds = self._unmaskedBoundsOfRows(array("B", initializer).tostring(), window.width, window.height)
+        if bounds is not None:
+          bounds = (bounds[0] + window.ulx, bounds[1] + window.uly, bounds[2] + window.ulx, bounds[3] + window.uly)
+    else:
+      bounds = self._unmaskedBoundsOfRows(self.pixelelArray.tostring(), self.width, self.height)
+    if bounds is None:
       raise RuntimeError, "Illegal to computeUnmaskedBounds on a total mask."
     
-    self.unmaskedBoundsCache = (ulx, uly, lrx, lry)
+    self.seedUnmaskedBounds(bounds)
     return self.unmaskedBoundsCache
+  
+  
+  def _unmaskedBoundsOfRows(self, values, width, height):
+    ''' Tuple of bounds of somewhat unmasked values in string values of width, height.  None if none. '''
+    totallyMasked = chr(PixmapMask.GIMP_TOTALLY_MASKED)
+    ulx = maxsize # initially very large
+    uly = maxsize
+    lrx = -1
+    lry = -1
+    for y in range(0, height):
+      row = values[y * width:(y + 1) * width]
+      unmasked = row.lstrip(totallyMasked)
+      if not unmasked:
+        continue
+      x = width - len(unmasked)   # first unmasked in row
+      if x < ulx: ulx = x # ul moves left or upper
+      if y < uly: uly = y
+      x = len(unmasked.rstrip(totallyMasked)) - 1 + x  # last unmasked in row
+      if x > lrx: lrx = x # lr moves lower or right
+      lry = y
+    if lrx < 0:
+      return None
+    return (ulx, uly, lrx, lry)
+
+
+
 
 
+" Hot methods counted while stats are enabled.  See stats.py. "
+stats.instrument(PixmapMask, '__getitem__', 'maskLookups')
+stats.instrument(PixmapMask, '_maskValueFromCoords', 'maskLookups')
+stats.instrument(PixmapMask, 'isTotallyNotSelected', 'maskLookups')
+stats.instrument(PixmapMask, 'isTotallySelected', 'maskLookups')
 
 
 
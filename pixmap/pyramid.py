@@ -0,0 +1,199 @@
+
+from array import array
+from operator import add, mul, floordiv
+
+import arraymap
+from bounds import Bounds
+from pixmapMask import PixmapMask
+from transforms import gatherer
+
+
+class Pyramid(object):
+  '''
+  Multi-resolution pyramid of an ArrayMap: level 0 is the map itself (not a copy),
+  each coarser level is half the width and height (rounded up) of the finer one, reduced from it.
+  Each level is an ArrayMap whose selection mask is reduced likewise (tracking partial selection.)
+
+  Reduction:
+  - 'box': mean of 2x2 pixels
+  - 'gaussian': separable binomial kernel 1 4 6 4 1 (approximately Gaussian), then every other pixel
+  Edges are extended.  Integer arithmetic, rounded.
+
+  Mask-aware (the default): colors are averaged weighted by the selection (weight = mask value * 256 + 1),
+  so selected pixels dominate, and unselected pixels do not bleed into selected ones.
+  Where nothing is selected, it is the plain average.
+
+  After writes to a level (usually the base), update(dirtyBounds) recomputes only the pixels of coarser levels
+  that depend on dirtyBounds, tile by tile.
+
+  Bulk: per row of a coarse level, map() of builtin operators over gathered rows of the fine level.
+
+
+  To test:
+  cd to the enclosing directory
+  python -m doctest -v pyramid.py
+
+  >>> from arraymap import ArrayMap
+  >>> base = ArrayMap(4, 2, 1, [0, 100, 10, 10,  0, 100, 30, 30], PixmapMask(4, [255, 255, 0, 0,  255, 255, 0, 0]))
+  >>> pyramid = Pyramid(base, 3)
+  >>> len(pyramid), [(level.width, level.height) for level in pyramid.levels]
+  (3, [(4, 2), (2, 1), (1, 1)])
+  >>> list(pyramid[1].pixelelArray), list(pyramid[1].selectionMask().pixelelArray)
+  ([50, 20], [255, 0])
+
+  Mask-aware: the selected pixel dominates
+  >>> list(pyramid[2].pixelelArray), list(pyramid[2].selectionMask().pixelelArray)
+  ([50], [128])
+  >>> list(Pyramid(base, 3, maskAware=False)[2].pixelelArray)
+  [35]
+
+  Incremental update
+  >>> base.pixelelArray[2:4] = array("B", [110, 110])
+  >>> pyramid.update(Bounds(2,0,3,0))
+  >>> list(pyramid[1].pixelelArray), list(pyramid[2].pixelelArray)
+  ([50, 70], [50])
+
+  Updating invalidates what coarse masks cache
+  >>> sorted(set(pyramid[1].selectionMask().randomSelectedIndices(20, seed=1)))
+  [0]
+  >>> base.selectionMask().setPixelels([2, 3], [255, 255])
+  >>> pyramid.update(Bounds(2,0,3,0))
+  >>> sorted(set(pyramid[1].selectionMask().randomSelectedIndices(20, seed=1)))
+  [0, 1]
+
+  Gaussian
+  >>> list(Pyramid(ArrayMap(4, 1, 2, [8, 0, 8, 0, 8, 0, 8, 0], PixmapMask(4, [0] * 4)), 2, 'gaussian')[1].pixelelArray)
+  [8, 0, 8, 0]
+  '''
+
+  " Taps (offset from 2 * coarse coordinate, weight) of kernels, in each dimension "
+  TAPS = {'box': ((0, 1), (1, 1)),
+          'gaussian': ((-2, 1), (-1, 4), (0, 6), (1, 4), (2, 1))}
+
+  " Weight of a pixel by its mask value "
+  _WEIGHT_TABLE = [value * 256 + 1 for value in range(0, 256)]
+
+
+  def __init__(self, map, levelCount, method='box', maskAware=True, tileSize=64):
+    '''
+    levelCount: count of levels, including map.  Fewer if a level is already 1x1.
+    tileSize: of tiles in which levels are computed and updated.
+    '''
+    assert method in Pyramid.TAPS, "Unknown reduction: " + str(method)
+    assert levelCount >= 1
+    self.taps = Pyramid.TAPS[method]
+    self.maskAware = maskAware
+    self.tileSize = tileSize
+    self.levels = [map]
+    while len(self.levels) < levelCount and (map.width > 1 or map.height > 1):
+      width = (map.width + 1) // 2
+      height = (map.height + 1) // 2
+      coarse = arraymap.ArrayMap(width, height, map.bpp, array("B", [0]) * (width * height * map.bpp),
+                                 PixmapMask(width, array("B", [0]) * (width * height), height))
+      self.levels.append(coarse)
+      map = coarse
+    for level in range(1, len(self.levels)):
+      self._reduce(level, Bounds(0, 0, self.levels[level].width - 1, self.levels[level].height - 1))
+
+
+  def __len__(self):
+    return len(self.levels)
+
+  def __getitem__(self, level):
+    ''' ArrayMap of level (0 is the base.) '''
+    return self.levels[level]
+
+
+  def update(self, dirtyBounds, level=0):
+    '''
+    Recompute coarser levels where they depend on dirtyBounds (a Bounds) of level, after writes to it.
+    '''
+    first = self.taps[0][0]
+    last = self.taps[-1][0]
+    for coarseLevel in range(level + 1, len(self.levels)):
+      coarse = self.levels[coarseLevel]
+      # Coarse pixel c depends on fine pixels 2c+first .. 2c+last (clamped at edges)
+      ulx = max(0, -((last - dirtyBounds.ulx) // 2))
+      uly = max(0, -((last - dirtyBounds.uly) // 2))
+      lrx = min(coarse.width - 1, (dirtyBounds.lrx - first) // 2)
+      lry = min(coarse.height - 1, (dirtyBounds.lry - first) // 2)
+      if ulx > lrx or uly > lry:
+        return
+      dirtyBounds = Bounds(ulx, uly, lrx, lry)
+      self._reduce(coarseLevel, dirtyBounds)
+
+
+  def _reduce(self, level, bounds):
+    ''' Recompute bounds of level from the next finer level, tile by tile. '''
+    fine = self.levels[level - 1]
+    coarse = self.levels[level]
+    for tile in bounds.tiles(self.tileSize, self.tileSize):
+      self._reduceRect(fine, coarse, tile)
+    coarse.selectionMask()._invalidateCaches()
+
+
+  def _reduceRect(self, fine, coarse, bounds):
+    ''' Recompute pixels and mask values of coarse in bounds from fine. '''
+    taps = self.taps
+    first = taps[0][0]
+    total = sum([weight for _, weight in taps]) ** 2
+    bpp = fine.bpp
+    rowLength = fine.width * bpp
+    count = bounds.width
+    # Fine columns of the taps of coarse columns, clamped to fine
+    gather = gatherer([min(max(x, 0), fine.width - 1)
+                       for x in range(2 * bounds.ulx + first, 2 * bounds.lrx + taps[-1][0] + 1)])
+    fineValues = fine.pixelelArray
+    fineMaskValues = fine.selectionMask().pixelelArray
+    halves = [total // 2] * count
+    totals = [total] * count
+
+    rowCache = {}
+    def planesOfRow(y):
+      ''' Gathered planes of fine row y: channels (times weights if mask-aware), mask, weights. '''
+      if y not in rowCache:
+        start = y * rowLength
+        maskRow = gather(fineMaskValues[y * fine.width:(y + 1) * fine.width])
+        channels = [gather(fineValues[start + channel:start + rowLength:bpp]) for channel in range(0, bpp)]
+        if self.maskAware:
+          weights = map(Pyramid._WEIGHT_TABLE.__getitem__, maskRow)
+          channels = [map(mul, channelRow, weights) for channelRow in channels]
+          rowCache[y] = channels + [maskRow, weights]
+        else:
+          rowCache[y] = channels + [maskRow]
+      return rowCache[y]
+
+    for y in bounds.rangeY():
+      # Vertical taps, then horizontal taps, of each plane
+      rows = [(planesOfRow(min(max(2 * y + offset, 0), fine.height - 1)), weight) for offset, weight in taps]
+      planes = []
+      for plane in range(0, len(rows[0][0])):
+        vertical = None
+        for planeRows, weight in rows:
+          term = planeRows[plane] if weight == 1 else map(mul, planeRows[plane], [weight] * len(planeRows[plane]))
+          vertical = term if vertical is None else map(add, vertical, term)
+        filtered = None
+        for offset, weight in taps:
+          term = vertical[offset - first::2][0:count]
+          if weight != 1:
+            term = map(mul, term, [weight] * count)
+          filtered = term if filtered is None else map(add, filtered, term)
+        planes.append(filtered)
+      # Fine rows no longer needed
+      for oldY in [oldY for oldY in rowCache if oldY < 2 * y + first]:
+        del rowCache[oldY]
+
+      if self.maskAware:
+        weights = planes[-1]
+        channels = [map(floordiv, map(add, plane, map(floordiv, weights, [2] * count)), weights) for plane in planes[0:bpp]]
+      else:
+        channels = [map(floordiv, map(add, plane, halves), totals) for plane in planes[0:bpp]]
+      maskRow = map(floordiv, map(add, planes[bpp], halves), totals)
+
+      row = array("B", [0]) * (count * bpp)
+      for channel in range(0, bpp):
+        row[channel::bpp] = array("B", channels[channel])
+      start = (y * coarse.width + bounds.ulx) * bpp
+      coarse.pixelelArray[start:start + count * bpp] = row
+      start = y * coarse.width + bounds.ulx
+      coarse.selectionMask().pixelelArray[start:start + count] = array("B", maskRow)
@@ -0,0 +1,258 @@
+'''
+Regions of 2D maps: flood fill and connected components.
+
+Works on a match string: one char per pixel, MATCHED or NOT_MATCHED, in row order,
+made from pixelels by tolerance (matchOfPixels) or from a mask (matchOfMask.)
+Since MATCHED is GIMP_SELECTION_TOTALLY_SELECTED, a match string is also the values of a PixmapMask.
+
+Knows nothing about ArrayMap or PixmapMask: see their methods floodFill() and labelComponents().
+
+Iterative (no recursion limit), by runs (spans) of matched pixels in rows:
+runs are found by str.find(), str.rfind() and regular expressions, and filled by slice assignment.
+The Python loops are per run, never per pixel.
+
+
+To test:
+cd to the enclosing directory
+python -m doctest -v regions.py
+
+A 4x3 map, 1 pixelel per pixel:
+1 1 0 1
+0 1 0 1
+1 1 0 0
+>>> from array import array
+>>> match = matchOfMask(array("B", [1, 1, 0, 1,  0, 1, 0, 1,  9, 1, 0, 0]))
+
+>>> filled, bounds = floodFill(match, 4, 3, 0)
+>>> list(filled), bounds
+([255, 255, 0, 0, 0, 255, 0, 0, 255, 255, 0, 0], (0, 0, 1, 2))
+>>> floodFill(match, 4, 3, 2)[1]
+
+Connectivity 8 joins diagonal neighbors
+>>> floodFill(matchOfMask(array("B", [1, 0, 0, 1])), 2, 2, 0, 8)[1]
+(0, 0, 1, 1)
+
+Components
+>>> components = labelComponents(match, 4, 3)
+>>> list(components.labels)
+[1, 1, 0, 2, 0, 1, 0, 2, 1, 1, 0, 0]
+>>> components.count(), components.counts, components.bounds
+(2, [5, 5, 2], [None, Bounds(0,0,1,2), Bounds(3,0,3,1)])
+>>> list(components.maskValues(2))
+[0, 0, 0, 255, 0, 0, 0, 255, 0, 0, 0, 0]
+
+Matching pixels by tolerance, here pixels near (10, 200)
+>>> matchOfPixels(array("B", [10, 200, 12, 199, 10, 100]), 2, (10, 200), 2)
+'\\xff\\xff\\x00'
+
+A long snake (recursion would overflow) is one component
+>>> snake = array("B", [1] * 100 + [0] * 99 + [1] + [1] * 100 + [1] + [0] * 99) * 25
+>>> floodFill(matchOfMask(snake), 100, 100, 0)[1]
+(0, 0, 99, 99)
+>>> labelComponents(matchOfMask(snake), 100, 100).count()
+1
+'''
+
+import re
+from array import array
+from operator import and_
+
+from bounds import Bounds
+
+
+MATCHED = chr(255)
+NOT_MATCHED = chr(0)
+
+" Translation table: mask values somewhat selected are matched "
+_MASK_TABLE = NOT_MATCHED + MATCHED * 255
+_RUN = re.compile(MATCHED + "+")
+
+
+
+'''
+Match strings.
+'''
+
+def matchOfPixels(values, bpp, pixel, tolerance=0):
+  '''
+  Match string of pixels (values: array of pixelels, bpp per pixel) whose every pixelel
+  differs from pixel's by at most tolerance.
+  '''
+  tables = ["".join([MATCHED if abs(value - pixel[channel]) <= tolerance else NOT_MATCHED for value in range(0, 256)])
+            for channel in range(0, bpp)]
+  if bpp == 1:
+    return values.tostring().translate(tables[0])
+  channelMatches = [array("B", values[channel::bpp].tostring().translate(tables[channel])) for channel in range(0, bpp)]
+  return array("B", reduce(lambda a, b: map(and_, a, b), channelMatches)).tostring()
+
+
+def matchOfMask(values):
+  ''' Match string of mask values somewhat selected (nonzero.) '''
+  return values.tostring().translate(_MASK_TABLE)
+
+
+
+'''
+Flood fill.
+'''
+
+def floodFill(match, width, height, seed, connectivity=4):
+  '''
+  Scanline flood fill of the matched pixels connected to seed (a pixel index.)
+
+  Returns tuple (filled, bounds): filled is an array of width*height mask values,
+  bounds is a tuple (ulx, uly, lrx, lry) of the filled pixels, or None if seed is not matched.
+  connectivity is 4 (edge neighbors) or 8 (also diagonal neighbors.)
+  '''
+  assert connectivity in (4, 8)
+  filled = bytearray(width * height)
+  if match[seed] != MATCHED:
+    return array("B", str(filled)), None
+  reach = 1 if connectivity == 8 else 0
+  ulx, uly, lrx, lry = width, height, -1, -1
+  # Stack of seeds: pixel indices, each in a run not yet filled
+  seeds = [seed]
+  while seeds:
+    index = seeds.pop()
+    if filled[index]:
+      continue
+    y = index // width
+    rowStart = y * width
+    rowEnd = rowStart + width
+    # Extend to the run containing index
+    left = match.rfind(NOT_MATCHED, rowStart, index) + 1
+    if left == 0:
+      left = rowStart
+    right = match.find(NOT_MATCHED, index, rowEnd)
+    if right == -1:
+      right = rowEnd
+    filled[left:right] = MATCHED * (right - left)
+    ulx = min(ulx, left - rowStart)
+    lrx = max(lrx, right - 1 - rowStart)
+    uly = min(uly, y)
+    lry = max(lry, y)
+    # Seed each run in the adjacent rows that touches this run
+    start = max(left - reach, rowStart) - rowStart
+    end = min(right + reach, rowEnd) - rowStart
+    for adjacentStart in (rowStart - width, rowEnd):
+      if adjacentStart < 0 or adjacentStart >= len(match):
+        continue
+      for run in _RUN.finditer(match, adjacentStart + start, adjacentStart + end):
+        if not filled[run.start()]:
+          seeds.append(run.start())
+  return array("B", str(filled)), (ulx, uly, lrx, lry)
+
+
+
+'''
+Connected components.
+'''
+
+class Components(object):
+  '''
+  Connected components of a match string.
+
+  Knows:
+  - labels: array of width*height labels, 0 for not matched, else 1..count() in order of first pixel
+  - counts: list of count of pixels, per label (counts[0] is of not matched pixels)
+  - bounds: list of Bounds, per label (bounds[0] is None)
+  - runs: list of tuples (label, y, startX, endX) with endX exclusive
+  '''
+  def __init__(self, width, height, labels, counts, bounds, runs):
+    self.width = width
+    self.height = height
+    self.labels = labels
+    self.counts = counts
+    self.bounds = bounds
+    self.runs = runs
+
+  def count(self):
+    ''' Count of components. '''
+    return len(self.counts) - 1
+
+  def maskValues(self, label):
+    ''' Array of mask values: selected where pixels have label. '''
+    values = bytearray(self.width * self.height)
+    for runLabel, y, start, end in self.runs:
+      if runLabel == label:
+        values[y * self.width + start:y * self.width + end] = MATCHED * (end - start)
+    return array("B", str(values))
+
+
+def labelComponents(match, width, height, connectivity=4):
+  '''
+  Components of the matched pixels.
+
+  One pass over rows, labeling each run: a run touching runs of the previous row joins their labels
+  (union-find of labels), else starts a new label.  Then each run is labeled by its component.
+  '''
+  assert connectivity in (4, 8)
+  reach = 1 if connectivity == 8 else 0
+  parents = []  # union-find forest of provisional labels
+  runs = []     # (provisional label, y, start, end)
+  previousRuns = []
+  for y in range(0, height):
+    rowStart = y * width
+    currentRuns = []
+    first = 0   # first run of previous row that may touch a current run
+    for run in _RUN.finditer(match, rowStart, rowStart + width):
+      start = run.start() - rowStart
+      end = run.end() - rowStart
+      while first < len(previousRuns) and previousRuns[first][1] + reach <= start:
+        first += 1
+      label = None
+      other = first
+      while other < len(previousRuns) and previousRuns[other][0] < end + reach:
+        if label is None:
+          label = _find(parents, previousRuns[other][2])
+        else:
+          label = _union(parents, label, previousRuns[other][2])
+        other += 1
+      if label is None:
+        label = len(parents)
+        parents.append(label)
+      currentRuns.append((start, end, label))
+      runs.append((label, y, start, end))
+    previousRuns = currentRuns
+
+  # Number components in order of first pixel
+  componentOfRoot = {}
+  labels = array("i", [0]) * (width * height)
+  counts = [width * height]
+  bounds = [None]
+  componentRuns = []
+  for label, y, start, end in runs:
+    root = _find(parents, label)
+    component = componentOfRoot.get(root)
+    if component is None:
+      component = componentOfRoot[root] = len(counts)
+      counts.append(0)
+      bounds.append((start, y, end - 1, y))
+    else:
+      ulx, uly, lrx, lry = bounds[component]
+      bounds[component] = (min(ulx, start), uly, max(lrx, end - 1), y)
+    counts[component] += end - start
+    counts[0] -= end - start
+    labels[y * width + start:y * width + end] = array("i", [component]) * (end - start)
+    componentRuns.append((component, y, start, end))
+  bounds = [None] + [Bounds(*tupleBounds) for tupleBounds in bounds[1:]]
+  return Components(width, height, labels, counts, bounds, componentRuns)
+
+
+def _find(parents, label):
+  ''' Root of label, halving the path. '''
+  while parents[label] != label:
+    parents[label] = parents[parents[label]]
+    label = parents[label]
+  return label
+
+def _union(parents, label, other):
+  ''' Join trees of labels, returning the root. '''
+  root = _find(parents, label)
+  otherRoot = _find(parents, other)
+  if root == otherRoot:
+    return root
+  if otherRoot < root:
+    root, otherRoot = otherRoot, root
+  parents[otherRoot] = root
+  return root
@@ -0,0 +1,210 @@
+
+import re
+from array import array
+from bisect import bisect_left
+from operator import sub
+
+from bounds import Bounds
+import morphology
+import regions
+import transforms
+
+
+BOUNDARY = chr(255)
+_BOUNDARY_RUN = re.compile(BOUNDARY + "+")
+
+" Offsets (dx, dy) of the 8 neighbors, clockwise from west (y is down) "
+_NEIGHBORS = ((-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1))
+
+
+class SelectionBoundary(object):
+  '''
+  Boundary of the selection of a mask: somewhat selected pixels with a not selected 8-neighbor
+  (outside the mask is not selected.)
+
+  Knows:
+  - flags: bytearray of one flag per pixel, BOUNDARY or 0
+  - indices(): array of flat indices (y * width + x) of boundary pixels, in row order
+  - contours(): list of contours, each a list of flat indices of boundary pixels in order around the contour
+
+  Computed in one bulk pass: selected less selected eroded by 3x3 (see morphology.py),
+  only within the unmasked bounds (expanded by one.)
+
+  Incremental: update(changedIndices) after mask values at changedIndices change (e.g. region growing)
+  recomputes flags of only those pixels and their neighbors, and inserts into (removes from) indices() those that changed:
+  the cost is proportional to the count of changed pixels (and a move of the boundary indices), not the area.
+  contours() are traced again when next asked.
+
+  See PixmapMask.selectionBoundary().
+
+
+  To test:
+  cd to the enclosing directory
+  python -m doctest -v selectionBoundary.py
+
+  A 4x4 mask with a selected 3x3 square
+  >>> values = array("B", [255, 255, 255, 0] * 3 + [0] * 4)
+  >>> boundary = SelectionBoundary(values, 4, 4)
+  >>> boundary.indices()
+  array('l', [0, 1, 2, 4, 6, 8, 9, 10])
+  >>> boundary.contours()
+  [[0, 1, 2, 6, 10, 9, 8, 4]]
+
+  Growing: select a pixel, and update incrementally
+  >>> values[3] = 128
+  >>> boundary.update([3])
+  >>> boundary.indices()
+  array('l', [0, 1, 2, 3, 4, 6, 8, 9, 10])
+  >>> boundary.indices() == SelectionBoundary(values, 4, 4).indices()
+  True
+
+  A hole has its own contour: a 5x5 selection less its center
+  >>> square = array("B", [255] * 25)
+  >>> square[12] = 0
+  >>> outer, hole = SelectionBoundary(square, 5, 5).contours()
+  >>> outer
+  [0, 1, 2, 3, 4, 9, 14, 19, 24, 23, 22, 21, 20, 15, 10, 5]
+  >>> hole
+  [6, 11, 16, 17, 18, 13, 8, 7]
+  '''
+
+  def __init__(self, values, width, height, bounds=None):
+    '''
+    values: array of width*height mask values.
+    bounds: tuple of unmasked bounds if known.
+    '''
+    self.values = values
+    self.width = width
+    self.height = height
+    self.flags = bytearray(width * height)
+    self._indices = None
+    self._contours = None
+    if bounds is None:
+      selected = regions.matchOfMask(values)
+      if regions.MATCHED not in selected:
+        return
+      bounds = (0, 0, width - 1, height - 1)
+    rect = Bounds(*bounds).expand(1).clipTo(width, height)
+    cropped = transforms.crop(values, width, height, 1, rect)[0]
+    selected = array("B", regions.matchOfMask(cropped))
+    # Selected, less the selected whose neighbors are all selected
+    edges = array("B", map(sub, selected, morphology.erode(selected, rect.width, rect.height, 1))).tostring()
+    for row in range(0, rect.height):
+      start = (rect.uly + row) * width + rect.ulx
+      self.flags[start:start + rect.width] = edges[row * rect.width:(row + 1) * rect.width]
+
+
+  def indices(self):
+    ''' Array of flat indices of boundary pixels, in row order. '''
+    if self._indices is None:
+      self._indices = array("l")
+      for run in _BOUNDARY_RUN.finditer(str(self.flags)):
+        self._indices.extend(range(run.start(), run.end()))
+    return self._indices
+
+
+  def maskValues(self):
+    ''' Array of mask values: BOUNDARY (totally selected) at boundary pixels. '''
+    return array("B", str(self.flags))
+
+
+  def update(self, changedIndices):
+    '''
+    Recompute flags of pixels at changedIndices (whose mask values changed) and their neighbors,
+    keeping indices() up to date.
+    '''
+    width = self.width
+    toCheck = set()
+    for index in changedIndices:
+      y, x = divmod(index, width)
+      toCheck.add(index)
+      for dx, dy in _NEIGHBORS:
+        if self._isInside(x + dx, y + dy):
+          toCheck.add(index + dy * width + dx)
+    indices = self._indices
+    for index in toCheck:
+      y, x = divmod(index, width)
+      flag = 255 if self._isBoundary(x, y) else 0
+      if flag != self.flags[index]:
+        self.flags[index] = flag
+        if indices is not None:
+          position = bisect_left(indices, index)
+          if flag:
+            indices.insert(position, index)
+          else:
+            indices.pop(position)
+    self._contours = None
+
+
+  def _isInside(self, x, y):
+    return 0 <= x < self.width and 0 <= y < self.height
+
+  def _isSelected(self, x, y):
+    return self._isInside(x, y) and self.values[y * self.width + x] > 0
+
+  def _isBoundary(self, x, y):
+    if not self._isSelected(x, y):
+      return False
+    for dx, dy in _NEIGHBORS:
+      if not self._isSelected(x + dx, y + dy):
+        return True
+    return False
+
+
+  def contours(self):
+    '''
+    List of contours, each a list of flat indices of boundary pixels in order around the contour,
+    starting at its first pixel in row order: clockwise around a selected region, counterclockwise around a hole.
+    A pixel on a thin part appears more than once.
+
+    Tracing by edge neighbors (see _trace()), stopping when a step (from a pixel in a direction) repeats.
+    The cost is proportional to the length of the boundary, not the area.
+    '''
+    if self._contours is None:
+      self._contours = []
+      traced = set()
+      for start in self.indices():
+        if start not in traced:
+          contour = self._trace(start)
+          traced.update(contour)
+          self._contours.append(contour)
+    return self._contours
+
+
+  def _trace(self, start):
+    '''
+    Contour through start, a boundary pixel, as a list of flat indices.
+
+    Follows the boundary keeping not selected pixels on the left, by steps to edge neighbors:
+    turn left if possible, else go straight, else turn right, else go back.
+    So a pixel not selected only at a corner (diagonal), which is on the boundary, is on the contour.
+    '''
+    width = self.width
+    x, y = start % width, start // width
+    # Heading (an even direction) keeping a not selected neighbor left, or left and behind (diagonal)
+    notSelected = [direction for direction, (dx, dy) in enumerate(_NEIGHBORS) if not self._isSelected(x + dx, y + dy)]
+    edgeNotSelected = [direction for direction in notSelected if direction % 2 == 0]
+    if edgeNotSelected:
+      heading = (edgeNotSelected[0] + 2) % 8
+    else:
+      heading = (notSelected[0] + 3) % 8
+    contour = [start]
+    # Steps taken, as pixel index * 8 + heading: the contour is closed when a step repeats
+    steps = set()
+    while True:
+      for turn in (-2, 0, 2, 4):
+        direction = (heading + turn) % 8
+        dx, dy = _NEIGHBORS[direction]
+        if self._isSelected(x + dx, y + dy):
+          break
+      else:
+        # Isolated pixel
+        return contour
+      step = (y * width + x) * 8 + direction
+      if step in steps:
+        # Closed: the last pixel appended is start again
+        contour.pop()
+        return contour
+      steps.add(step)
+      x, y, heading = x + dx, y + dy, direction
+      contour.append(y * width + x)
@@ -0,0 +1,149 @@
+
+import re
+from array import array
+from bisect import bisect_left
+from random import Random
+
+
+" Runs of somewhat selected mask values "
+_SELECTED_RUN = re.compile("[^\\x00]+")
+
+
+class SelectionSampler(object):
+  '''
+  Random sampling of the selected pixels of a mask, in constant time per sample.
+
+  Knows:
+  - indices: array of the flat indices (y * width + x) of somewhat selected pixels, in row order
+  - for weighted sampling (built when first used): indices ordered by mask value,
+    the range of each mask value in that order, and an alias table (Vose) over mask values.
+
+  Uniform sampling picks an index of indices.
+  Weighted sampling (probability proportional to mask value, i.e. degree of selection)
+  picks a mask value from the alias table (weight: value times count of pixels of value),
+  then a pixel of that value uniformly: two random numbers per sample, whatever the count of pixels.
+
+  Built in bulk: runs of selected pixels by regular expression over rows within the unmasked bounds,
+  ordering by a sort keyed by the mask array's own __getitem__ (a loop in C.)
+
+  See PixmapMask.selectionSampler(), ArrayMap.randomSelectedCoords().
+
+
+  To test:
+  cd to the enclosing directory
+  python -m doctest -v selectionSampler.py
+
+  >>> from random import Random
+  >>> values = array("B", [0, 255, 0,  0, 0, 1])
+  >>> sampler = SelectionSampler(values, 3, 2)
+  >>> sampler.indices
+  array('l', [1, 5])
+  >>> len(sampler)
+  2
+  >>> sorted(set(sampler.sample(100, random=Random(1))))
+  [1, 5]
+
+  Weighted by mask value: index 5 has 1/256 of the weight
+  >>> samples = sampler.sample(2560, weighted=True, random=Random(1))
+  >>> samples.count(5) < 30
+  True
+
+  Empty selection
+  >>> SelectionSampler(array("B", [0, 0]), 2, 1).sample(1)
+  Traceback (most recent call last):
+  ...
+  ValueError: No pixel is selected.
+  '''
+
+  def __init__(self, values, width, height, bounds=None):
+    '''
+    values: array of width*height mask values.
+    bounds: tuple of unmasked bounds if known: only rows within them are scanned.
+    '''
+    self.values = values
+    self.indices = array("l")
+    if bounds is None:
+      firstRow, lastRow = 0, height - 1
+    else:
+      firstRow, lastRow = bounds[1], bounds[3]
+    strings = values[firstRow * width:(lastRow + 1) * width].tostring()
+    offset = firstRow * width
+    for run in _SELECTED_RUN.finditer(strings):
+      self.indices.extend(range(offset + run.start(), offset + run.end()))
+    # Built when first used
+    self.aliasTable = None
+
+
+  def __len__(self):
+    ''' Count of selected pixels. '''
+    return len(self.indices)
+
+
+  def sample(self, count, weighted=False, random=None):
+    '''
+    List of count flat indices of selected pixels, random with replacement.
+    weighted: probability proportional to mask value, else uniform.
+    random: a random.Random (default a new one, seeded by the system.)
+    '''
+    if not self.indices:
+      raise ValueError("No pixel is selected.")
+    if random is None:
+      random = Random()
+    uniform = random.random
+    if not weighted:
+      size = len(self.indices)
+      return map(self.indices.__getitem__, [int(uniform() * size) for _ in range(0, count)])
+
+    if self.aliasTable is None:
+      self._buildAliasTable()
+    orderedIndices = self.orderedIndices
+    valueRanges = self.valueRanges
+    probabilities, aliases = self.aliasTable
+    classCount = len(probabilities)
+    result = []
+    for _ in range(0, count):
+      position = uniform() * classCount
+      valueClass = int(position)
+      if position - valueClass >= probabilities[valueClass]:
+        valueClass = aliases[valueClass]
+      start, end = valueRanges[valueClass]
+      result.append(orderedIndices[start + int(uniform() * (end - start))])
+    return result
+
+
+  def _buildAliasTable(self):
+    '''
+    Order indices by mask value, find the range of each value, and build an alias table (Vose's method)
+    over the values present, weighted by value times count.
+    '''
+    self.orderedIndices = array("l", sorted(self.indices, key=self.values.__getitem__))
+    orderedValues = map(self.values.__getitem__, self.orderedIndices)
+    self.valueRanges = []
+    weights = []
+    start = 0
+    while start < len(orderedValues):
+      value = orderedValues[start]
+      end = bisect_left(orderedValues, value + 1, start)
+      self.valueRanges.append((start, end))
+      weights.append(value * (end - start))
+      start = end
+
+    classCount = len(weights)
+    total = float(sum(weights))
+    scaled = [weight * classCount / total for weight in weights]
+    probabilities = [1.0] * classCount
+    aliases = range(0, classCount)
+    small = [index for index, weight in enumerate(scaled) if weight < 1.0]
+    large = [index for index, weight in enumerate(scaled) if weight >= 1.0]
+    while small and large:
+      less = small.pop()
+      more = large.pop()
+      probabilities[less] = scaled[less]
+      aliases[less] = more
+      scaled[more] -= 1.0 - scaled[less]
+      if scaled[more] < 1.0:
+        small.append(more)
+      else:
+        large.append(more)
+    # Remaining (by rounding) have probability 1
+    self.aliasTable = (probabilities, aliases)
@@ -0,0 +1,243 @@
+
+import time
+
+
+class Stats(object):
+  '''
+  Opt-in instrumentation of pixel access, mask lookup and PixelRgn traffic.
+
+  Disabled by default.
+  While disabled, hot methods (subscripting etc.) are the plain, uninstrumented methods:
+  there is no overhead, not even a test of a flag.
+  Enabling wraps the registered hot methods with counting wrappers;
+  disabling restores the original methods.
+
+  Coarse grained events (Pixmap init and flush) test isEnabled() themselves,
+  since their cost dwarfs the test.
+
+  Counters are exposed as a snapshot dict.
+  Messages (formerly unconditional prints) and timings are passed to logger callbacks.
+  A logger is any callable taking one string.
+
+
+  To test:
+  cd to the enclosing directory
+  python -m doctest -v stats.py
+
+  >>> from arraymap import ArrayMap
+  >>> from pixmapMask import PixmapMask
+  >>> from coord import Coord
+  >>> from stats import stats
+  >>> from array import array
+
+  Disabled: nothing is counted or logged.
+  >>> map = ArrayMap(2, 1, 1, [0, 0], PixmapMask(2, [255, 0]))
+  >>> map[Coord(0,0)]
+  array('B', [0])
+  >>> stats.snapshot()['pixelReads']
+  0
+
+  Enabled: messages go to the loggers, hot methods are counted.
+  >>> messages = []
+  >>> stats.addLogger(messages.append)
+  >>> stats.enable()
+  >>> map = ArrayMap(2, 1, 1, [0, 0], PixmapMask(2, [255, 0]))
+  >>> messages
+  ['Size of pixelelArray 2']
+  >>> map[Coord(0,0)] = array('B', [7])
+  >>> map[Coord(0,0)]
+  array('B', [7])
+  >>> map.isTotallySelected(Coord(1,0))
+  False
+  >>> snapshot = stats.snapshot()
+  >>> snapshot['pixelReads'], snapshot['pixelWrites'], snapshot['maskLookups']
+  (1, 1, 1)
+
+  A snapshot is a copy, not changed by later counting.
+  >>> map[Coord(1,0)]
+  array('B', [0])
+  >>> snapshot['pixelReads'], stats.snapshot()['pixelReads']
+  (1, 2)
+
+  Disabling restores the original methods and keeps the counts.
+  Coarse grained events are timed into an explicit pair of counters.
+  >>> startTime = stats.startTimer()
+  >>> stats.stopTimer(startTime, 'flushes', 'flushSeconds')
+  >>> stats.snapshot()['flushes'], messages[-1].startswith('flushSeconds ')
+  (1, True)
+
+  Another thread counts into its own dict, merged later by the main thread.
+  >>> background = {}
+  >>> stats.count('bytesWritten', 3, background)
+  >>> stats.snapshot()['bytesWritten'], background
+  (0, {'bytesWritten': 3})
+  >>> stats.merge(background)
+  >>> stats.snapshot()['bytesWritten'], background
+  (3, {})
+
+  >>> stats.disable()
+  >>> map[Coord(1,0)]
+  array('B', [0])
+  >>> stats.snapshot()['pixelReads']
+  2
+  >>> stats.reset()
+  >>> stats.snapshot()['pixelReads']
+  0
+  >>> stats.removeLogger(messages.append)
+  '''
+
+  # Names of counters, in the order of a snapshot.
+  COUNTERS = ('pixelReads', 'pixelWrites', 'maskLookups',
+              'bytesRead', 'bytesWritten',
+              'inits', 'initSeconds', 'flushes', 'flushSeconds')
+
+  def __init__(self):
+    self.enabled = False
+    self.loggers = []
+    # list of (class, method name, counter name), registered by the instrumented modules
+    self.instrumentedMethods = []
+    # original (unwrapped) methods, keyed by (class, method name), while enabled
+    self._originalMethods = {}
+    self.reset()
+
+
+  '''
+  Responsibility: switch.
+  '''
+  def isEnabled(self):
+    return self.enabled
+
+  def enable(self):
+    ''' Start counting: wrap hot methods. '''
+    if self.enabled:
+      return
+    for cls, methodName, counterName in self.instrumentedMethods:
+      original = cls.__dict__[methodName]
+      self._originalMethods[(cls, methodName)] = original
+      setattr(cls, methodName, self._countingWrapper(original, counterName))
+    self.enabled = True
+
+  def disable(self):
+    ''' Stop counting: restore hot methods.  Counts are retained until reset(). '''
+    if not self.enabled:
+      return
+    for (cls, methodName), original in self._originalMethods.items():
+      setattr(cls, methodName, original)
+    self._originalMethods = {}
+    self.enabled = False
+
+
+  def instrument(self, cls, methodName, counterName):
+    '''
+    Register a hot method of a class to be counted while enabled.
+
+    The method must be defined by cls itself (not inherited.)
+    '''
+    assert methodName in cls.__dict__, "Instrumented method must be defined by the class."
+    assert counterName in self.counters
+    self.instrumentedMethods.append((cls, methodName, counterName))
+
+
+  def _countingWrapper(self, method, counterName):
+    counters = self.counters
+    def wrapper(*args, **kwargs):
+      counters[counterName] += 1
+      return method(*args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+  '''
+  Responsibility: counters.
+  '''
+  def reset(self):
+    ''' Zero all counters. '''
+    # Cleared in place: counting wrappers hold a reference to this dict.
+    if not hasattr(self, 'counters'):
+      self.counters = {}
+    for name in Stats.COUNTERS:
+      self.counters[name] = 0
+
+  def snapshot(self):
+    ''' Copy of the counters, as a dict. '''
+    return dict(self.counters)
+
+  def count(self, counterName, amount=1, counters=None):
+    '''
+    Add to a counter.  For coarse grained events only: caller should test isEnabled().
+    counters: a dict to add into instead of self's counters, e.g. by another thread.  See merge().
+    '''
+    if counters is None:
+      counters = self.counters
+    counters[counterName] = counters.get(counterName, 0) + amount
+
+  def merge(self, counters):
+    '''
+    Add counts of a dict (see count(counters=)) into self's counters, and clear it.
+
+    Counters are not thread safe (+= is not atomic, and the counting wrappers do not lock.)
+    So another thread (e.g. a FlushWorker) counts into its own dict,
+    which the main thread merges when the other thread is done (e.g. in Pixmap.waitFlushed().)
+    '''
+    for name, amount in counters.items():
+      self.counters[name] += amount
+    counters.clear()
+
+
+  '''
+  Responsibility: timing of coarse grained events (init, flush.)
+  '''
+  def startTimer(self):
+    ''' Return a start time, or None if disabled. '''
+    if self.enabled:
+      return time.time()
+    return None
+
+  def stopTimer(self, startTime, counterName, secondsName, counters=None):
+    '''
+    Count an event in counter counterName, and accumulate the time since startTime into counter secondsName.
+
+    startTime is the result of startTimer().  Does nothing if it is None (was disabled at start.)
+    counters: a dict to count into instead of self's counters, as for count().  Then the time is not logged.
+    '''
+    if startTime is None:
+      return
+    elapsed = time.time() - startTime
+    self.count(counterName, 1, counters)
+    self.count(secondsName, elapsed, counters)
+    if counters is None:
+      self.log(secondsName, elapsed)
+
+
+  '''
+  Responsibility: logging.
+  '''
+  def addLogger(self, logger):
+    ''' logger is a callable taking one string. '''
+    self.loggers.append(logger)
+
+  def removeLogger(self, logger):
+    self.loggers.remove(logger)
+
+  def log(self, *args):
+    '''
+    Pass a message to loggers, only if enabled.
+    Args are formatted like a print statement: str of each, separated by spaces.
+    '''
+    if not self.enabled:
+      return
+    message = " ".join([str(arg) for arg in args])
+    for logger in self.loggers:
+      logger(message)
+
+
+
+def printLogger(message):
+  ''' A logger that prints, i.e. the behaviour before Stats existed: stats.addLogger(printLogger) '''
+  print(message)
+
+
+
+" The single instance, shared by all instrumented classes. "
+stats = Stats()
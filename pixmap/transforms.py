@@ -0,0 +1,280 @@
+
+'''
+Geometric transforms of 2D maps stored as 1D arrays of pixelels (as in ArrayMap and PixmapMask.)
+
+Functions take (values, width, height, bpp, ...) where values is an array of width*height*bpp pixelels,
+and return a tuple (values, width, height) of a new array and its dimensions.
+
+Knows nothing about ArrayMap or PixmapMask: see their methods crop(), flipH(), etc.
+
+Bulk: by row slices and strided (extended) slices, and by gathering with operator.itemgetter,
+so the Python loops are per row (or per channel), never per pixel.
+Interpolation is in integer fixed point, using map() of builtin operators over whole rows.
+(Operands of map() are lists of equal length: Python 2 map() pads shorter operands with None.)
+
+
+To test:
+cd to the enclosing directory
+python -m doctest -v transforms.py
+
+A 3x2 map, 1 pixelel per pixel:
+0 1 2
+3 4 5
+>>> from array import array
+>>> values = array("B", range(6))
+
+>>> crop(values, 3, 2, 1, Bounds(1,0,2,1))
+(array('B', [1, 2, 4, 5]), 2, 2)
+>>> flipH(values, 3, 2, 1)
+(array('B', [2, 1, 0, 5, 4, 3]), 3, 2)
+>>> flipV(values, 3, 2, 1)
+(array('B', [3, 4, 5, 0, 1, 2]), 3, 2)
+>>> transpose(values, 3, 2, 1)
+(array('B', [0, 3, 1, 4, 2, 5]), 2, 3)
+
+Rotation is by quarter turns clockwise
+>>> rotate90(values, 3, 2, 1)
+(array('B', [3, 0, 4, 1, 5, 2]), 2, 3)
+>>> rotate90(values, 3, 2, 1, 2)
+(array('B', [5, 4, 3, 2, 1, 0]), 3, 2)
+>>> rotate90(values, 3, 2, 1, -1)
+(array('B', [2, 5, 1, 4, 0, 3]), 2, 3)
+
+Multiple pixelels per pixel keep their order within the pixel
+>>> flipH(array("B", [1, 2, 3, 4]), 2, 1, 2)
+(array('B', [3, 4, 1, 2]), 2, 1)
+>>> transpose(array("B", [1, 2, 3, 4]), 2, 1, 2)
+(array('B', [1, 2, 3, 4]), 1, 2)
+
+Resize
+>>> resize(array("B", [0, 100]), 2, 1, 1, 4, 1, 'nearest')
+(array('B', [0, 0, 100, 100]), 4, 1)
+>>> resize(array("B", [0, 100, 200, 255]), 2, 2, 1, 1, 2, 'nearest')
+(array('B', [100, 255]), 1, 2)
+>>> resize(array("B", [0, 100]), 2, 1, 1, 4, 1, 'bilinear')
+(array('B', [0, 25, 75, 100]), 4, 1)
+>>> resize(array("B", [0, 100, 200, 255]), 2, 2, 1, 1, 1, 'box')
+(array('B', [139]), 1, 1)
+>>> resize(array("B", [10, 20, 30, 40]), 4, 1, 1, 2, 1, 'box')
+(array('B', [15, 35]), 2, 1)
+'''
+
+from array import array
+from operator import add, mul, rshift, floordiv, itemgetter
+
+from bounds import Bounds
+
+
+
+'''
+Copies: crop, flips, transpose, rotations.
+'''
+
+def crop(values, width, height, bpp, bounds):
+  ''' Subrect bounds (our notion of Bounds, inside width, height.) '''
+  assert bounds.ulx >= 0 and bounds.uly >= 0 and bounds.lrx < width and bounds.lry < height, "Illegal bounds."
+  rowStride = width * bpp
+  start = bounds.ulx * bpp
+  end = (bounds.lrx + 1) * bpp
+  result = array(values.typecode)
+  for y in bounds.rangeY():
+    result.extend(values[y * rowStride + start:y * rowStride + end])
+  return result, bounds.width, bounds.height
+
+
+def flipV(values, width, height, bpp):
+  ''' Mirror top to bottom: reverse order of rows. '''
+  rowStride = width * bpp
+  result = array(values.typecode)
+  for y in range(height - 1, -1, -1):
+    result.extend(values[y * rowStride:(y + 1) * rowStride])
+  return result, width, height
+
+
+def flipH(values, width, height, bpp):
+  ''' Mirror left to right: reverse order of pixels in each row. '''
+  # Reversing each channel reverses order of all pixels (rotate 180), then restore order of rows.
+  result, _, _ = _rotate180(values, width, height, bpp)
+  return flipV(result, width, height, bpp)
+
+
+def _rotate180(values, width, height, bpp):
+  ''' Reverse order of pixels, keeping order of pixelels within pixel. '''
+  result = array(values.typecode, values)
+  for channel in range(0, bpp):
+    result[channel::bpp] = values[channel::bpp][::-1]
+  return result, width, height
+
+
+def transpose(values, width, height, bpp):
+  ''' Mirror about the diagonal from upper left: pixel at (x,y) moves to (y,x). '''
+  rowStride = width * bpp
+  columnStride = height * bpp   # stride between rows of result
+  result = array(values.typecode, values)   # Only for its size: every pixelel is assigned
+  for y in range(0, height):
+    # Row y of values is column y of result
+    for channel in range(0, bpp):
+      result[y * bpp + channel::columnStride] = values[y * rowStride + channel:(y + 1) * rowStride:bpp]
+  return result, height, width
+
+
+def rotate90(values, width, height, bpp, turns=1):
+  ''' Rotate by turns quarter turns clockwise (negative is counterclockwise.) '''
+  turns = turns % 4
+  if turns == 0:
+    return array(values.typecode, values), width, height
+  elif turns == 2:
+    return _rotate180(values, width, height, bpp)
+  result, width, height = transpose(values, width, height, bpp)
+  if turns == 1:
+    return flipH(result, width, height, bpp)
+  else:
+    return flipV(result, width, height, bpp)
+
+
+
+'''
+Resampling.
+
+Pixel centers are aligned: pixel x of the result samples position (x + 0.5) * width / newWidth - 0.5 of the source.
+'''
+
+def resize(values, width, height, bpp, newWidth, newHeight, method='nearest'):
+  '''
+  Resample to newWidth, newHeight.
+
+  method:
+  - 'nearest': nearest source pixel
+  - 'bilinear': interpolate four nearest source pixels
+  - 'box': average of source pixels covered by result pixel (for reducing.)
+  '''
+  assert newWidth > 0 and newHeight > 0
+  if method == 'nearest':
+    return _resizeNearest(values, width, height, bpp, newWidth, newHeight)
+  elif method == 'bilinear':
+    return _resizeBilinear(values, width, height, bpp, newWidth, newHeight)
+  elif method == 'box':
+    return _resizeBox(values, width, height, bpp, newWidth, newHeight)
+  else:
+    raise ValueError("Unknown resize method: " + str(method))
+
+
+def gatherer(indices):
+  '''
+  Function returning a sequence of the elements at indices of its argument.
+  Like itemgetter(*indices), but always returning a sequence.
+  '''
+  if len(indices) == 1:
+    index = indices[0]
+    return lambda values: (values[index],)
+  return itemgetter(*indices)
+
+
+def _pixelelIndices(pixelIndices, bpp):
+  ''' Indices of pixelels of the pixels at pixelIndices. '''
+  return [pixelIndex * bpp + channel for pixelIndex in pixelIndices for channel in range(0, bpp)]
+
+
+def _resizeNearest(values, width, height, bpp, newWidth, newHeight):
+  rowStride = width * bpp
+  gather = gatherer(_pixelelIndices([(2 * x + 1) * width // (2 * newWidth) for x in range(0, newWidth)], bpp))
+  result = array(values.typecode)
+  lastSourceY = None
+  for y in range(0, newHeight):
+    sourceY = (2 * y + 1) * height // (2 * newHeight)
+    if sourceY != lastSourceY:
+      row = array(values.typecode, gather(values[sourceY * rowStride:(sourceY + 1) * rowStride]))
+      lastSourceY = sourceY
+    result.extend(row)
+  return result, newWidth, newHeight
+
+
+def _interpolationWeights(size, newSize):
+  '''
+  For each result position: the two source positions and the fixed point (8 bit) weight of the second.
+  Returns lists (lower, upper, weight).
+  '''
+  lowers = []
+  uppers = []
+  weights = []
+  for position in range(0, newSize):
+    source = (position + 0.5) * size / float(newSize) - 0.5
+    source = min(max(source, 0.0), size - 1.0)
+    lower = int(source)
+    lowers.append(lower)
+    uppers.append(min(lower + 1, size - 1))
+    weights.append(int(round((source - lower) * 256)))
+  return lowers, uppers, weights
+
+
+def _resizeBilinear(values, width, height, bpp, newWidth, newHeight):
+  rowStride = width * bpp
+  lefts, rights, weights = _interpolationWeights(width, newWidth)
+  gatherLeft = gatherer(_pixelelIndices(lefts, bpp))
+  gatherRight = gatherer(_pixelelIndices(rights, bpp))
+  rightWeights = [weight for weight in weights for _ in range(0, bpp)]
+  leftWeights = [256 - weight for weight in rightWeights]
+
+  horizontalCache = {}
+  def horizontal(sourceY):
+    ''' Source row interpolated horizontally: list of ints scaled by 256. '''
+    if sourceY not in horizontalCache:
+      row = values[sourceY * rowStride:(sourceY + 1) * rowStride]
+      if len(horizontalCache) == 2:
+        # Rows are used in order: keep only the last two
+        del horizontalCache[min(horizontalCache)]
+      horizontalCache[sourceY] = map(add, map(mul, gatherLeft(row), leftWeights),
+                                          map(mul, gatherRight(row), rightWeights))
+    return horizontalCache[sourceY]
+
+  result = array(values.typecode)
+  rowLength = newWidth * bpp
+  halves = [32768] * rowLength
+  shifts = [16] * rowLength
+  tops, bottoms, weights = _interpolationWeights(height, newHeight)
+  for y in range(0, newHeight):
+    top = horizontal(tops[y])
+    bottom = horizontal(bottoms[y])
+    weight = weights[y]
+    # Scaled by 256 * 256: round and unscale
+    row = map(add, map(mul, top, [256 - weight] * rowLength), map(mul, bottom, [weight] * rowLength))
+    result.extend(array(values.typecode, map(rshift, map(add, row, halves), shifts)))
+  return result, newWidth, newHeight
+
+
+def _footprints(size, newSize):
+  ''' For each result position, (start, end) of source positions it covers.  End exclusive. '''
+  result = []
+  for position in range(0, newSize):
+    start = position * size // newSize
+    end = max(start + 1, (position + 1) * size // newSize)
+    result.append((start, end))
+  return result
+
+
+def _resizeBox(values, width, height, bpp, newWidth, newHeight):
+  rowStride = width * bpp
+  '''
+  Horizontal sums: gather the j'th source pixel of each footprint, for each j up to the widest footprint.
+  Footprints narrower than j gather a zero pixel appended to the row.
+  '''
+  columnFootprints = _footprints(width, newWidth)
+  gatherers = []
+  for j in range(0, max([end - start for start, end in columnFootprints])):
+    pixelIndices = [start + j if start + j < end else width for start, end in columnFootprints]
+    gatherers.append(gatherer(_pixelelIndices(pixelIndices, bpp)))
+  columnCounts = [end - start for start, end in columnFootprints for _ in range(0, bpp)]
+  zeroPixel = array(values.typecode, [0] * bpp)
+
+  result = array(values.typecode)
+  for rowStart, rowEnd in _footprints(height, newHeight):
+    sums = [0] * (newWidth * bpp)
+    for sourceY in range(rowStart, rowEnd):
+      row = values[sourceY * rowStride:(sourceY + 1) * rowStride] + zeroPixel
+      for gather in gatherers:
+        sums = map(add, sums, gather(row))
+    counts = [count * (rowEnd - rowStart) for count in columnCounts]
+    halfCounts = [count // 2 for count in counts]
+    # Rounded average
+    result.extend(array(values.typecode, map(floordiv, map(add, sums, halfCounts), counts)))
+  return result, newWidth, newHeight